@@ -2,25 +2,70 @@
 
 Attributes:
     log (Logger): The logger for the covid_dashboard.
+    page_cache (TTLCache): Rendered dashboard pages, keyed on their ETag.
+    PAGE_CACHE_SIZE (int): The most rendered dashboard pages cached, across every area.
+    NATIONS (tuple): The nations an area can be in.
+    MAX_LOCATION_LENGTH (int): The longest location name accepted from a request.
+    LOCATION_PATTERN (Pattern): The characters a location name from a request can contain.
+    payload_cache (TTLCache): Compressed JSON API responses, keyed on their ETag.
+    startup_times (dict): How many seconds it took to create the app ("app_created") and until
+        the dashboard had data to show ("first_data").
 """
 from datetime import datetime, timedelta
+from time import perf_counter
+from typing import Any, Optional, Tuple
+from urllib.parse import urlencode
+import gzip
+import hashlib
+import json
+import re
 import threading
 import logging
-from flask import Flask, render_template, Markup, request, redirect
+from flask import (
+    Flask,
+    Response,
+    render_template,
+    Markup,
+    request,
+    redirect,
+    make_response,
+    abort,
+)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+import covid_data_handler
+import covid_news_handling
+import dashboard_logging
+import scheduler
 from scheduler import (
-    scheduler,
     scheduled_events,
     schedule_event,
-    remove_event,
-    keep_alive,
+    cancel_event,
+    start_scheduler,
 )
-from covid_data_handler import get_covid_data
-from covid_news_handling import get_news, remove_article
-from utils import get_settings, time_until
-
-LOG_FORMAT = (
-    "%(asctime)s (%(thread)d) [%(levelname)s]: %(message)s (%(funcName)s in %(module)s)"
+from covid_data_handler import (
+    find_covid_data,
+    get_covid_data,
+    internal_covid_data,
+    is_unknown_area,
+    load_persisted_covid_data,
 )
+from covid_news_handling import get_news, load_persisted_news, remove_article
+from cache import TTLCache
+from dashboard_logging import configure_logging
+from metrics import CONTENT_TYPE, instrument, registry
+from utils import (
+    bump_dashboard_version,
+    get_area_version,
+    get_dashboard_version,
+    get_settings,
+    load_settings,
+    time_until,
+)
+
 CLOCK_ICON = (
     "<svg xmlns='http://www.w3.org/2000/svg' width='16' height='16' fill='currentColor'"
     " class='bi bi-clock' viewBox='0 0 16 16'><path d='M8 3.5a.5.5 0 0 0-1 0V9a.5.5 0 0"
@@ -43,37 +88,271 @@ DEATHS_ICON = (
     " 0 1 0-1h3.15l1.88-5.17A.5.5 0 0 1 6 2Z'/></svg>"
 )
 NEW_ICON = "<span class='badge badge-primary'>New</span>"
+API_MAX_AGE = 30
+MIN_COMPRESS_SIZE = 512
+LOADING = Markup("<em>Loading...</em>")
+PAGE_CACHE_SIZE = 64
+NATIONS = ("England", "Northern Ireland", "Scotland", "Wales")
+MAX_LOCATION_LENGTH = 64
+LOCATION_PATTERN = re.compile(r"[\w ,.'&()-]+")
 
-logging.basicConfig(
-    filename="covid_dashboard.log", format=LOG_FORMAT, level=logging.DEBUG
-)
+configure_logging()
 log = logging.getLogger("covid_dashboard")
+startup_times: dict = {"app_created": None, "first_data": None}
+page_cache = TTLCache("rendered page", maxsize=PAGE_CACHE_SIZE, ttl=60)
+payload_cache = TTLCache("JSON payload", maxsize=32, ttl=300)
+
+
+def collect_metrics() -> list:
+    """Collect the metrics that are counted by the caches, single flights, scheduler and logging
+    themselves.
+
+    Returns:
+        list[tuple]: The name, type, help and samples of each metric family.
+    """
+    caches = [
+        covid_data_handler.internal_covid_data,
+        covid_data_handler.internal_national_data,
+        covid_data_handler.internal_local_series,
+        page_cache,
+        payload_cache,
+    ]
+    flights = [
+        covid_data_handler.covid_data_flight,
+        covid_data_handler.national_data_flight,
+        covid_data_handler.local_series_flight,
+        covid_news_handling.news_flight,
+    ]
+    cache_stats = [(cache.name, cache.stats()) for cache in caches]
+    flight_stats = [(flight.name, flight.stats()) for flight in flights]
+    families = []
+    for stat, kind, documentation in [
+        ("hits", "counter", "How many cache lookups found a fresh value."),
+        ("misses", "counter", "How many cache lookups found no fresh value."),
+        ("evictions", "counter", "How many entries were evicted from the cache."),
+        ("size", "gauge", "How many entries are in the cache."),
+        ("hit_rate", "gauge", "The fraction of cache lookups that found a fresh value."),
+    ]:
+        name = f"dashboard_cache_{stat}"
+        sample_name = f"{name}_total" if kind == "counter" else name
+        samples = [(sample_name, {"cache": cache}, stats[stat]) for cache, stats in cache_stats]
+        families.append((name, kind, documentation, samples))
+    for stat, documentation in [
+        ("calls", "How many single flight calls ran."),
+        ("shared", "How many callers waited for a single flight call already running."),
+    ]:
+        name = f"dashboard_single_flight_{stat}"
+        samples = [
+            (f"{name}_total", {"name": flight}, stats[stat]) for flight, stats in flight_stats
+        ]
+        families.append((name, "counter", documentation, samples))
+
+    counters = {
+        "dashboard_scheduler_wakeups": (
+            "How many times the scheduler thread woke up.",
+            scheduler.scheduler.wakeups,
+        ),
+    }
+    pipeline = dashboard_logging.log_pipeline
+    if pipeline is not None:
+        records, dropped, enqueue_time = pipeline.queue_handler.counters()
+        counters["dashboard_log_records"] = (
+            "How many log records were queued.",
+            records,
+        )
+        counters["dashboard_log_dropped"] = (
+            "How many log records were dropped because the queue was full.",
+            dropped,
+        )
+        counters["dashboard_log_enqueue_seconds"] = (
+            "How many seconds callers spent queueing log records.",
+            enqueue_time,
+        )
+    for name, (documentation, value) in counters.items():
+        families.append((name, "counter", documentation, [(f"{name}_total", {}, value)]))
+    families.append(
+        (
+            "dashboard_scheduled_events",
+            "gauge",
+            "How many events are scheduled.",
+            [("dashboard_scheduled_events", {}, len(scheduled_events))],
+        )
+    )
+    return families
+
+
+registry.add_collector(collect_metrics)
+
 
+def json_response(data: Any, max_age: int = API_MAX_AGE) -> Response:
+    """Create a compact JSON response with an ETag, compressed with brotli or gzip if the client
+    accepts it. Responses with an ETag the client already has are sent as 304 Not Modified.
 
-def create_app(testing: bool = False) -> Flask:
+    Args:
+        data (Any): The JSON serialisable response data.
+        max_age (int, optional): How many seconds clients may cache the response for.
+            Defaults to API_MAX_AGE.
+
+    Returns:
+        Response: The JSON response.
+    """
+    body = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    encoding = None
+    if len(body) >= MIN_COMPRESS_SIZE:
+        if brotli is not None and "br" in request.accept_encodings:
+            encoding = "br"
+        elif "gzip" in request.accept_encodings:
+            encoding = "gzip"
+    etag = hashlib.sha1(body).hexdigest()[:20] + (f"-{encoding}" if encoding else "")
+
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+    else:
+        if encoding is not None:
+            compressed = payload_cache.get(etag)
+            if compressed is None:
+                if encoding == "br":
+                    compressed = brotli.compress(body)
+                else:
+                    compressed = gzip.compress(body)
+                payload_cache.set(etag, compressed)
+            body = compressed
+        response = make_response(body)
+        response.mimetype = "application/json"
+        if encoding is not None:
+            response.headers["Content-Encoding"] = encoding
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = f"public, max-age={max_age}"
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def get_area(location: Optional[str] = None) -> Tuple[str, str]:
+    """Get the area a request is for, from the URL path or the "location" and "nation" query
+    parameters, defaulting to the configured location and nation.
+
+    Args:
+        location (Optional[str], optional): The location from the URL path. Defaults to None.
+
+    Returns:
+        tuple: The location and nation.
+    """
+    default_location, default_nation = get_settings(  # pylint: disable=unbalanced-tuple-unpacking
+        "location", "nation"
+    )
+    location = " ".join((location or request.args.get("location", "")).split())
+    location = location or default_location
+    nation = request.args.get("nation") or default_nation
+    if (location, nation) == (default_location, default_nation):
+        return location, nation
+    if len(location) > MAX_LOCATION_LENGTH or not LOCATION_PATTERN.fullmatch(location):
+        log.warning("Rejected request for invalid location %s", location[:MAX_LOCATION_LENGTH])
+        abort(400)
+    if nation not in NATIONS:
+        log.warning("Rejected request for invalid nation %s", nation[:MAX_LOCATION_LENGTH])
+        abort(400)
+    return location, nation
+
+
+def area_url(location: str, nation: str) -> str:
+    """Get the URL of the dashboard for an area.
+
+    Args:
+        location (str): Location name.
+        nation (str): Nation name.
+
+    Returns:
+        str: "/" for the configured area, otherwise "/" with location and nation query parameters.
+    """
+    if (location, nation) == tuple(get_settings("location", "nation")):
+        return "/"
+    return "/?" + urlencode({"location": location, "nation": nation})
+
+
+def get_area_covid_data(location: str, nation: str) -> Optional[dict]:
+    """Get the COVID data of an area. The configured area is updated if it is not fresh, other
+    areas are only fetched in the background so requests for them never wait for the API.
+
+    Args:
+        location (str): Location name.
+        nation (str): Nation name.
+
+    Returns:
+        Optional[dict]: COVID data, or None if it is being fetched.
+    """
+    if area_url(location, nation) == "/":
+        return get_covid_data(location, nation)
+    if is_unknown_area(location, nation):
+        log.info("No COVID data exists for %s, %s", location, nation)
+        abort(404)
+    return find_covid_data(location, nation)
+
+
+def revalidate_data(location: str, nation: str) -> None:
+    """Force an update of the news and the COVID data for a location.
+
+    Args:
+        location (str): Location name.
+        nation (str): Nation name.
+    """
+    get_news(force_update=True)
+    get_covid_data(location, nation, force_update=True)
+
+
+def create_app(testing: bool = False, defer_loading: bool = False) -> Flask:
     """Create the covid_dashboard flask app.
 
     Args:
         testing (bool): If the server is in testing mode or not. Defaults to False.
+        defer_loading (bool): If the app should be returned straight away, with the initial data
+            loaded in the background and the dashboard showing loading messages until it
+            arrives. Defaults to False.
 
     Returns:
         Flask: the covid_dashboard flask app.
     """
-    thread = threading.Thread(target=scheduler.run)
+    started = perf_counter()
     flask_app = Flask(__name__)
     flask_app.testing = testing
     log.info(
-        "Creating covid_dashboard flask app %s with testing = %s", __name__, testing
+        "Creating covid_dashboard flask app %s with testing = %s and defer_loading = %s",
+        __name__,
+        testing,
+        defer_loading,
     )
 
     # pylint: disable=W0632
     location, nation = get_settings(
         "location", "nation"
     )
+    data_loaded = threading.Event()
 
-    # update_news()
-    get_news(force_update=True)
-    get_covid_data(location, nation, force_update=True)
+    def first_data_loaded():
+        if not data_loaded.is_set():
+            startup_times["first_data"] = perf_counter() - started
+            log.info("First data loaded after %.3fs", startup_times["first_data"])
+            data_loaded.set()
+            # Pages rendered while loading must not be reused, so the version changes only after
+            # the data is marked as loaded
+            bump_dashboard_version()
+
+    def load_data():
+        revalidate_data(location, nation)
+        first_data_loaded()
+
+    # Serve persisted data straight away if there is any, even if it is stale, and update it in
+    # the background
+    load_persisted_covid_data()
+    persisted = internal_covid_data.peek((location, nation, "ltla")) is not None
+    if load_persisted_news() and persisted:
+        log.info("Using persisted data, updating it in the background")
+        first_data_loaded()
+        threading.Thread(target=load_data, daemon=True).start()
+    elif defer_loading:
+        log.info("Loading initial data in the background")
+        threading.Thread(target=load_data, daemon=True).start()
+    else:
+        load_data()
     schedule_event(
         timedelta(hours=0, minutes=0),
         "Default COVID Update",
@@ -90,77 +369,107 @@ def create_app(testing: bool = False) -> Flask:
         True,
         new=False,
     )
-    keep_alive()
-    thread.start()
-    log.info("Starting scheduler tread with ID = %s", thread.native_id)
+    start_scheduler()
+    startup_times["app_created"] = perf_counter() - started
+    log.info("Created app after %.3fs", startup_times["app_created"])
 
     @flask_app.route("/")
-    def main():
-        """Handles input requests if any, otherwise renders the COVID dashboard"""
+    @flask_app.route("/area/<path:location>")
+    @instrument
+    def main(location: Optional[str] = None):
+        """Handles input requests if any, otherwise renders the COVID dashboard for the requested
+        area"""
 
         # GET PAGE VARIABLES & CONTENT
-        log.info("Requested /")
+        log.info("Requested %s", request.path)
 
-        # pylint: disable=unbalanced-tuple-unpacking
-        (
-            favicon,
-            image,
-            title,
-            location,
-            nation,
-        ) = get_settings(
-            "favicon", "image", "title", "location", "nation"
-        )
+        # The page only changes with the dashboard version, the version of the areas COVID data,
+        # and the minute scheduled event times are shown to, so it is only rendered again when
+        # one of them changes
+        load_settings()
+        location, nation = get_area(location)
+        if is_unknown_area(location, nation):
+            abort(404)
+        area = hashlib.sha1(f"{location}\n{nation}".encode("utf-8")).hexdigest()[:10]
+        version = f"{get_dashboard_version()}.{get_area_version((location, nation, 'ltla'))}"
+        etag = f"{version}-{datetime.now():%Y%m%d%H%M}-{area}"
+        if request.if_none_match.contains(etag):
+            log.info("Page for %s, %s has not changed", location, nation)
+            response = make_response("", 304)
+        else:
+            page = page_cache.get(etag)
+            if page is None:
+                page = render_dashboard(location, nation)
+                page_cache.set(etag, page)
+            response = make_response(page)
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    @instrument
+    def render_dashboard(location: str, nation: str) -> str:
+        """Renders the COVID dashboard for an area.
 
-        news_articles = get_news()
+        Args:
+            location (str): Location name.
+            nation (str): Nation name.
+
+        Returns:
+            str: The rendered page.
+        """
+        # pylint: disable=unbalanced-tuple-unpacking
+        favicon, image, title = get_settings("favicon", "image", "title")
+        # Forms keep the area when it is not the configured one
+        area = None if area_url(location, nation) == "/" else (location, nation)
 
-        covid_data = get_covid_data(location, nation)
+        # Don't wait for the initial data if it is being loaded in the background
+        if data_loaded.is_set():
+            news_articles = get_news()
+            covid_data = get_area_covid_data(location, nation)
+        else:
+            log.info("Initial data is still loading")
+            news_articles = []
+            covid_data = None
 
         # Format Strings
         log.info("Formatting data")
         title = Markup(f"<strong>{title}</strong>")
-        location = Markup(f"<strong>{location}</strong>")
-        nation_location = Markup(f"<strong>{nation}</strong>")
-        # pylint: disable=E1136
-        # pylint: disable=E1136
-        local_7day_infections = (
-            None
-            if covid_data["local_7day"]
-            is None
-            else f"{covid_data['local_7day']:,}"
-        )
-        # pylint: disable=E1136
-        # pylint: disable=E1136
-        national_7day_infections = (
-            None
-            if covid_data["national_7day"]
-            is None
-            else f"{covid_data['national_7day']:,}"
-        )
-        # pylint: disable=E1136
-        # pylint: disable=E1136
-        hospital_cases = (
-            None
-            if covid_data["hospital"] is None
-            else Markup(
-                f"{HOSPITAL_ICON} {covid_data['hospital']:,} hospital cases"
+        # The location and nation can come from the request, so they are escaped
+        location = Markup("<strong>{}</strong>").format(location)
+        nation_location = Markup("<strong>{}</strong>").format(nation)
+        if covid_data is None:
+            local_7day_infections = national_7day_infections = LOADING
+            hospital_cases = deaths_total = LOADING
+        else:
+            # pylint: disable=E1136
+            local_7day_infections = (
+                None
+                if covid_data["local_7day"]
+                is None
+                else f"{covid_data['local_7day']:,}"
             )
-        )
-        # pylint: disable=E1136
-        # pylint: disable=E1136
-        deaths_total = (
-            None
-            if covid_data["deaths"] is None
-            else Markup(
-                f"{DEATHS_ICON} {covid_data['deaths']:,} total deaths"
+            # pylint: disable=E1136
+            national_7day_infections = (
+                None
+                if covid_data["national_7day"]
+                is None
+                else f"{covid_data['national_7day']:,}"
             )
-        )
-
-        for article in news_articles:
-            time = datetime.strptime(article["publishedAt"], "%Y-%m-%dT%H:%M:%S%z")
-            article["content"] = Markup(
-                f"<u>{time.strftime('%I:%M %p %d/%m/%y')}</u><br>{article['description']} <a"
-                f" href='{article['url']}' target='_blank'>Read More.</a>"
+            # pylint: disable=E1136
+            hospital_cases = (
+                None
+                if covid_data["hospital"] is None
+                else Markup(
+                    f"{HOSPITAL_ICON} {covid_data['hospital']:,} hospital cases"
+                )
+            )
+            # pylint: disable=E1136
+            deaths_total = (
+                None
+                if covid_data["deaths"] is None
+                else Markup(
+                    f"{DEATHS_ICON} {covid_data['deaths']:,} total deaths"
+                )
             )
 
         for update in scheduled_events:
@@ -176,11 +485,15 @@ def create_app(testing: bool = False) -> Flask:
             time = update["target_time"]
             time_hours = time.seconds // 3600
             time_minutes = (time.seconds // 60) % 60
-            time_to = str(time_until(time))
+            # Rounded down to the minute, so the page does not change every second
+            time_to = time_until(time)
+            time_to = str(time_to - timedelta(seconds=time_to.seconds % 60))
             new = ""
             if update["new"] is True:
                 update["new"] = False
                 new = "<br>" + NEW_ICON
+                # The event should not be shown as new next time the page is rendered
+                bump_dashboard_version()
             update["content"] = Markup(
                 f"{CLOCK_ICON} <u>{time_hours:02d}:{time_minutes:02d}</u><br>{repeating} for"
                 f" {updating} in {time_to} {new}"
@@ -201,8 +514,65 @@ def create_app(testing: bool = False) -> Flask:
             hospital_cases=hospital_cases,
             deaths_total=deaths_total,
             news_articles=news_articles[:4],
+            area=area,
+        )
+
+    @flask_app.route("/api/covid")
+    @flask_app.route("/api/covid/<path:location>")
+    def api_covid(location: Optional[str] = None):
+        """Returns the COVID data for the requested location as JSON."""
+        log.info("Requested %s", request.path)
+        location, nation = get_area(location)
+        covid_data = get_area_covid_data(location, nation) if data_loaded.is_set() else None
+        return json_response(
+            {
+                "location": location,
+                "nation": nation,
+                "loading": covid_data is None,
+                "data": covid_data,
+            }
         )
 
+    @flask_app.route("/api/news")
+    def api_news():
+        """Returns the news articles as JSON, without their rendered HTML."""
+        log.info("Requested /api/news")
+        news_articles = get_news() if data_loaded.is_set() else []
+        return json_response(
+            [
+                {
+                    "title": article["title"],
+                    "description": article["description"],
+                    "url": article["url"],
+                    "publishedAt": article["publishedAt"],
+                }
+                for article in news_articles
+            ]
+        )
+
+    @flask_app.route("/api/events")
+    def api_events():
+        """Returns the scheduled events as JSON."""
+        log.info("Requested /api/events")
+        return json_response(
+            [
+                {
+                    "title": event["title"],
+                    "target_time": str(event["target_time"]),
+                    "repeat": event["repeat"],
+                    "data": event["data"],
+                    "news": event["news"],
+                }
+                for event in scheduled_events
+            ],
+            max_age=0,
+        )
+
+    @flask_app.route("/metrics")
+    def metrics():
+        """Returns the dashboards metrics in the Prometheus text format."""
+        return Response(registry.render(), content_type=CONTENT_TYPE)
+
     @flask_app.route("/index")
     def index():
         # Handle Inputs
@@ -212,10 +582,7 @@ def create_app(testing: bool = False) -> Flask:
         if "update_item" in request.args:
             title = request.args.get("update_item")
             log.info("Requested removal of event %s", title)
-            for event in scheduled_events:
-                if event["title"] == title:
-                    remove_event(title)
-                    scheduler.cancel(event["sched_event"])
+            cancel_event(title)
 
         # Handle Remove News Article Request
         if "notif" in request.args:
@@ -234,7 +601,7 @@ def create_app(testing: bool = False) -> Flask:
 
             supplied_time = request.args.get("update")
             # Make sure an event with the same title does not exist
-            if any(event["title"] == label for event in scheduled_events):
+            if label in scheduled_events:
                 log.warning(
                     "An event with the name %s already exists! Ignoring!", label
                 )
@@ -258,14 +625,16 @@ def create_app(testing: bool = False) -> Flask:
                     label,
                 )
 
-        # Redirect user back to root URL to stop form being submitted again on a page reload
-        log.info("Redirecting user to /")
-        return redirect("/", code=302)
+        # Redirect user back to the area they were viewing to stop form being submitted again on
+        # a page reload
+        url = area_url(*get_area())
+        log.info("Redirecting user to %s", url)
+        return redirect(url, code=302)
 
     return flask_app
 
 
 if __name__ == "__main__":
     log.info("covid_dashboard running as main")
-    app = create_app()
+    app = create_app(defer_loading=True)
     app.run()
@@ -0,0 +1,437 @@
+""" Benchmarks the dashboards COVID data processing, news processing and page rendering against
+synthetic data, and compares the results with a stored baseline so regressions are caught.
+
+Run from the projects root directory with
+
+    python benchmarks/run_benchmarks.py
+
+Upstream APIs are never called. The COVID API and NewsAPI.org are replaced with a replay of
+synthetic responses, and persisted data is kept in a temporary directory.
+
+Attributes:
+    ROOT (Path): The projects root directory.
+    BASELINE_FILENAME (Path): The default baseline file.
+    DEFAULT_TOLERANCE (float): How much slower, or how much more memory, as a fraction of the
+        baseline, a benchmark can be before it is reported as a regression.
+    MIN_CHANGE_MS (float): Increases in median latency smaller than this are never regressions,
+        since timer and scheduling noise dominate the fastest benchmarks.
+    CSV_ROWS (tuple): The number of rows in each synthetic csv file.
+    NEWS_SIZES (tuple): The number of articles in each synthetic NewsAPI.org response.
+    BENCHMARKS (dict): Each benchmark, by name.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import tracemalloc
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# pylint: disable=wrong-import-position
+import covid_data_handler
+import covid_news_handling
+from covid_data_handler import (
+    covid_csv_series,
+    parse_csv_data,
+    process_covid_csv_data,
+    process_covid_csv_file,
+)
+from covid_news_handling import update_news
+from storage import PersistentCache
+from upstream import ReplayUpstream, set_upstream
+from utils import get_settings, sanitise_input
+
+BASELINE_FILENAME = ROOT / "benchmarks" / "baseline.json"
+DEFAULT_TOLERANCE = 0.5
+MIN_CHANGE_MS = 0.1
+CSV_ROWS = (1_000, 100_000)
+NEWS_SIZES = (10, 100, 1_000)
+CSV_HEADER = (
+    "areaCode,areaName,areaType,date,cumDailyNsoDeathsByDeathDate,hospitalCases,"
+    "newCasesBySpecimenDate"
+)
+
+
+def synthetic_records(rows: int, seed: int = 0) -> List[dict]:
+    """Create COVID data modelled on nation_2021-10-28.csv, most recent day first. The most
+    recent days have no deaths, and the most recent day has no new cases, as in real data.
+
+    Args:
+        rows (int): The number of days.
+        seed (int, optional): The random seed. Defaults to 0.
+
+    Returns:
+        list[dict]: A record for each day, keyed by "date" and metric.
+    """
+    generator = random.Random(seed)
+    latest = date(2021, 10, 28)
+    deaths = 140_000
+    records = []
+    for day in range(rows):
+        records.append(
+            {
+                "date": (latest - timedelta(days=day)).isoformat(),
+                "cumDailyNsoDeathsByDeathDate": None if day < 14 else deaths,
+                "hospitalCases": generator.randint(4_000, 8_000),
+                "newCasesBySpecimenDate": (
+                    None if day == 0 else generator.randint(20_000, 50_000)
+                ),
+            }
+        )
+        deaths = max(deaths - generator.randint(0, 200), 0)
+    return records
+
+
+def write_synthetic_csv(filename: Path, rows: int) -> Path:
+    """Write a synthetic csv file with the same columns as nation_2021-10-28.csv.
+
+    Args:
+        filename (Path): The csv file to write.
+        rows (int): The number of days.
+
+    Returns:
+        Path: The csv file.
+    """
+    lines = [CSV_HEADER]
+    for record in synthetic_records(rows):
+        values = [
+            record["cumDailyNsoDeathsByDeathDate"],
+            record["hospitalCases"],
+            record["newCasesBySpecimenDate"],
+        ]
+        lines.append(
+            f"E92000001,England,nation,{record['date']},"
+            + ",".join("" if value is None else str(value) for value in values)
+        )
+    filename.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return filename
+
+
+def synthetic_articles(count: int, seed: int = 0) -> List[dict]:
+    """Create a NewsAPI.org response, where some titles and descriptions contain HTML.
+
+    Args:
+        count (int): The number of articles.
+        seed (int, optional): The random seed. Defaults to 0.
+
+    Returns:
+        list[dict]: The articles, most recently published first.
+    """
+    generator = random.Random(seed)
+    published = datetime(2021, 12, 1, 12, tzinfo=timezone.utc)
+    articles = []
+    for index in range(count):
+        published -= timedelta(minutes=generator.randint(1, 30))
+        description = f"Article {index} about COVID-19 cases, vaccines and restrictions. " * 3
+        if index % 3 == 0:
+            description = f"<p>{description}<a href='https://example.com'>link</a> &amp; more</p>"
+        title = f"Update {index}"
+        if index % 5 == 0:
+            title = f"<b>Coronavirus {title}</b>"
+        articles.append(
+            {
+                "title": title,
+                "description": description,
+                "url": f"https://example.com/news/{index}",
+                "publishedAt": published.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            }
+        )
+    return articles
+
+
+def measure(func: Callable[[], object], iterations: int) -> dict:
+    """Time every call of a function, after a tenth as many warm up calls, then measure the peak
+    memory allocated by one more call.
+
+    Args:
+        func (Callable): The function to benchmark.
+        iterations (int): How many timed calls to make.
+
+    Returns:
+        dict: The iterations, throughput in calls per second, 50th, 95th and 99th percentile
+            latency in milliseconds, and the peak memory allocated in KiB.
+    """
+    for _ in range(max(iterations // 10, 1)):
+        func()
+    latencies = []
+    for _ in range(iterations):
+        started = perf_counter()
+        func()
+        latencies.append(perf_counter() - started)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return summarise(latencies, peak)
+
+
+def summarise(latencies: List[float], peak_memory: int) -> dict:
+    """Summarise the latencies of a benchmark.
+
+    Args:
+        latencies (list[float]): The seconds each call took.
+        peak_memory (int): The peak memory allocated by a call, in bytes.
+
+    Returns:
+        dict: The iterations, throughput, latency percentiles in milliseconds and peak memory in
+            KiB.
+    """
+    if len(latencies) > 1:
+        percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+        p50, p95, p99 = percentiles[49], percentiles[94], percentiles[98]
+    else:
+        p50 = p95 = p99 = latencies[0]
+    return {
+        "iterations": len(latencies),
+        "throughput": len(latencies) / sum(latencies) if sum(latencies) else None,
+        "p50_ms": p50 * 1000,
+        "p95_ms": p95 * 1000,
+        "p99_ms": p99 * 1000,
+        "peak_kib": peak_memory / 1024,
+    }
+
+
+def csv_benchmarks(directory: Path, scale: float) -> Dict[str, dict]:
+    """Benchmark parsing and processing synthetic csv files of each size in CSV_ROWS.
+
+    Args:
+        directory (Path): Where the csv files are written.
+        scale (float): Multiplies the number of iterations.
+
+    Returns:
+        dict[str, dict]: The results of each benchmark.
+    """
+    results = {}
+    for rows in CSV_ROWS:
+        filename = str(write_synthetic_csv(directory / f"nation_{rows}.csv", rows))
+        iterations = _iterations(1_000 // (rows // 1_000 + 1), scale)
+        parsed = parse_csv_data(filename)
+        results[f"parse_csv_data[{rows}]"] = measure(lambda: parse_csv_data(filename), iterations)
+        results[f"process_covid_csv_data[{rows}]"] = measure(
+            lambda: process_covid_csv_data(parsed), iterations
+        )
+        results[f"process_covid_csv_file[{rows}]"] = measure(
+            lambda: process_covid_csv_file(filename), iterations
+        )
+        results[f"covid_csv_series[{rows}]"] = measure(
+            lambda: covid_csv_series(filename), iterations
+        )
+    return results
+
+
+def news_benchmarks(scale: float) -> Dict[str, dict]:
+    """Benchmark processing NewsAPI.org responses of each size in NEWS_SIZES, from scratch and as
+    an incremental update of the current news, and sanitising their HTML.
+
+    Args:
+        scale (float): Multiplies the number of iterations.
+
+    Returns:
+        dict[str, dict]: The results of each benchmark.
+    """
+    results = {}
+    original_request = covid_news_handling.news_API_request
+    try:
+        for size in NEWS_SIZES:
+            articles = synthetic_articles(size)
+            iterations = _iterations(2_000 // (size // 10 + 1), scale)
+            covid_news_handling.news_API_request = lambda *args, **kwargs: articles
+            results[f"update_news[{size}]"] = measure(update_news, iterations)
+            current = update_news()
+            results[f"update_news_incremental[{size}]"] = measure(
+                lambda: update_news(current_news=current), iterations
+            )
+
+            def sanitise_all(articles=articles):
+                sanitise_input.cache_clear()
+                for article in articles:
+                    sanitise_input(article["title"])
+                    sanitise_input(article["description"])
+
+            results[f"sanitise_input[{size}]"] = measure(sanitise_all, iterations)
+    finally:
+        covid_news_handling.news_API_request = original_request
+    return results
+
+
+def flask_benchmarks(directory: Path, scale: float) -> Dict[str, dict]:
+    """Benchmark requests to / and /index with the Flask test client, with the upstream APIs
+    replaced by a replay of synthetic responses.
+
+    Args:
+        directory (Path): Where persisted data is stored.
+        scale (float): Multiplies the number of iterations.
+
+    Returns:
+        dict[str, dict]: The results of each benchmark.
+    """
+    # pylint: disable=import-outside-toplevel
+    import app
+
+    fixtures = directory / "fixtures.json"
+    location, nation = get_settings(  # pylint: disable=unbalanced-tuple-unpacking
+        "location", "nation"
+    )
+    fixtures.write_text(
+        json.dumps(
+            {
+                "covid": {location: synthetic_records(700), nation: synthetic_records(700, 1)},
+                "news": synthetic_articles(100),
+            }
+        ),
+        encoding="utf-8",
+    )
+    set_upstream(ReplayUpstream(str(fixtures)))
+    cache = PersistentCache(str(directory / "benchmark-cache.sqlite3"))
+    covid_data_handler.persistent_cache = cache
+    covid_news_handling.persistent_cache = cache
+    client = app.create_app(testing=True).test_client()
+    iterations = _iterations(500, scale)
+    results = {}
+
+    results["GET /"] = measure(lambda: client.get("/"), iterations)
+    etag = client.get("/").headers["ETag"].strip('"')
+    results["GET / (not modified)"] = measure(
+        lambda: client.get("/", headers={"If-None-Match": f'"{etag}"'}), iterations
+    )
+
+    counter = iter(range(sys.maxsize))
+
+    def schedule_and_render():
+        label = f"Benchmark {next(counter)}"
+        client.get("/index", query_string={"update": "12:30", "two": label, "news": "news"})
+        client.get("/")
+        client.get("/index", query_string={"update_item": label})
+
+    results["GET /index, / (schedule and cancel)"] = measure(schedule_and_render, iterations)
+    results["GET /api/covid"] = measure(lambda: client.get("/api/covid"), iterations)
+    return results
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """Compare benchmark results with a baseline.
+
+    Args:
+        results (dict[str, dict]): The results of each benchmark.
+        baseline (dict[str, dict]): The baseline results of each benchmark.
+        tolerance (float): How much higher, as a fraction of the baseline, the median latency or
+            peak memory can be before it is a regression.
+
+    Returns:
+        list[str]: A description of each regression.
+    """
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        for metric in ("p50_ms", "peak_kib"):
+            limit = expected[metric] * (1 + tolerance)
+            if metric == "p50_ms":
+                limit = max(limit, expected[metric] + MIN_CHANGE_MS)
+            if result[metric] > limit:
+                regressions.append(
+                    f"{name}: {metric} {result[metric]:.3f} is over {limit:.3f}"
+                    f" ({expected[metric]:.3f} baseline)"
+                )
+    return regressions
+
+
+def print_results(results: Dict[str, dict], baseline: Dict[str, dict]) -> None:
+    """Print a table of benchmark results, with the change in median latency from the baseline.
+
+    Args:
+        results (dict[str, dict]): The results of each benchmark.
+        baseline (dict[str, dict]): The baseline results of each benchmark.
+    """
+    print(
+        f"{'benchmark':<40} {'ops/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+        f" {'peak KiB':>10} {'vs base':>8}"
+    )
+    for name, result in results.items():
+        expected = baseline.get(name)
+        change = (
+            f"{result['p50_ms'] / expected['p50_ms'] - 1:+.0%}"
+            if expected and expected["p50_ms"]
+            else ""
+        )
+        print(
+            f"{name:<40} {result['throughput']:>10.1f} {result['p50_ms']:>9.3f}"
+            f" {result['p95_ms']:>9.3f} {result['p99_ms']:>9.3f} {result['peak_kib']:>10.1f}"
+            f" {change:>8}"
+        )
+
+
+def _iterations(iterations: int, scale: float) -> int:
+    return max(int(iterations * scale), 2)
+
+
+BENCHMARKS = {
+    "csv": csv_benchmarks,
+    "news": lambda directory, scale: news_benchmarks(scale),
+    "flask": flask_benchmarks,
+}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the benchmarks, print their results and compare them with the baseline.
+
+    Args:
+        argv (Optional[list[str]], optional): Command line arguments. Defaults to sys.argv.
+
+    Returns:
+        int: The exit code, 1 if there are regressions.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument(
+        "--only",
+        action="append",
+        choices=list(BENCHMARKS),
+        help="Only run this group of benchmarks. Can be given more than once.",
+    )
+    parser.add_argument("--baseline", type=Path, default=BASELINE_FILENAME)
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="Save the results as the new baseline."
+    )
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="Multiplies the number of iterations."
+    )
+    parser.add_argument("--output", type=Path, help="Also write the results to a JSON file.")
+    args = parser.parse_args(argv)
+
+    # Only warnings are logged, so logging does not dominate the measurements
+    os.environ.setdefault("COVID_DASHBOARD_LOG_PRESET", "production")
+    results: Dict[str, dict] = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for group in args.only or BENCHMARKS:
+            results.update(BENCHMARKS[group](Path(directory), args.scale))
+
+    baseline = {}
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    print_results(results, baseline)
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=4), encoding="utf-8")
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps({**baseline, **results}, indent=4), encoding="utf-8")
+        print(f"Saved the baseline to {args.baseline}")
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
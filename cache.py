@@ -0,0 +1,248 @@
+""" Provides a size bounded, least recently used cache with per entry expiry times, used to store
+data from the upstream COVID and news APIs, and single flight coalescing of the requests that fill
+it.
+
+Attributes:
+    log (Logger): The logger for the covid_dashboard.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+log = logging.getLogger("covid_dashboard")
+
+
+class TTLCache:
+    """A thread safe, size bounded LRU cache where every entry has its own time to live.
+
+    Expired entries are not returned by get, but are kept until they are evicted so that stale
+    values can still be inspected with peek.
+
+    Attributes:
+        name (str): The name of the cache, used when logging.
+        maxsize (int): The maximum number of entries the cache can hold.
+        ttl (Optional[float]): The default time to live of an entry, in seconds. None means entries
+            never expire.
+        hits (int): The number of get calls that returned a fresh value.
+        misses (int): The number of get calls that found no fresh value.
+        evictions (int): The number of entries removed to keep the cache within maxsize.
+    """
+
+    def __init__(
+        self, name: str, maxsize: int = 128, ttl: Optional[float] = None
+    ) -> None:
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get_entry_age(key) is not None
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get a fresh value from the cache, and mark it as the most recently used.
+
+        Args:
+            key (Hashable): The key of the entry.
+            default (Any, optional): Returned if there is no fresh entry. Defaults to None.
+
+        Returns:
+            Any: The cached value, or default if it is missing or has expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry):
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Get a value from the cache even if it has expired, without affecting the hit/miss
+        counters or the LRU order.
+
+        Args:
+            key (Hashable): The key of the entry.
+            default (Any, optional): Returned if there is no entry. Defaults to None.
+
+        Returns:
+            Any: The cached value, or default if it is missing.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            return default if entry is None else entry[0]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store a value in the cache, evicting the least recently used entries if necessary.
+
+        Args:
+            key (Hashable): The key of the entry.
+            value (Any): The value to store.
+            ttl (Optional[float], optional): Time to live of this entry in seconds. Defaults to
+                the caches default ttl.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._entries[key] = (value, expires, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                evicted, _ = self._entries.popitem(last=False)
+                self.evictions += 1
+                log.info("Evicted %s from the %s cache", evicted, self.name)
+
+    def delete(self, key: Hashable) -> None:
+        """Remove an entry from the cache, if it exists.
+
+        Args:
+            key (Hashable): The key of the entry.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove every entry from the cache and reset its counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def keys(self) -> list:
+        """Get the keys of every entry in the cache, fresh or expired.
+
+        Returns:
+            list: The cache keys, from least to most recently used.
+        """
+        with self._lock:
+            return list(self._entries)
+
+    def get_entry_age(self, key: Hashable) -> Optional[float]:
+        """Get how long ago a fresh entry was stored.
+
+        Args:
+            key (Hashable): The key of the entry.
+
+        Returns:
+            Optional[float]: The age of the entry in seconds, or None if there is no fresh entry.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry):
+                return None
+            return time.monotonic() - entry[2]
+
+    def stats(self) -> dict:
+        """Get the current size and hit/miss counters of the cache.
+
+        Returns:
+            dict: The caches size, maxsize, hits, misses, evictions and hit_rate.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else None,
+            }
+
+    @staticmethod
+    def _expired(entry: tuple) -> bool:
+        expires = entry[1]
+        return expires is not None and time.monotonic() >= expires
+
+
+class _Flight:
+    """A call in progress, which other callers with the same key wait on."""
+
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key, so only one of them runs and the others wait
+    for and share its result. Used so that concurrent cache misses make one upstream request.
+
+    Attributes:
+        name (str): The name of the calls, used when logging.
+        calls (int): The number of calls that ran.
+        shared (int): The number of calls that waited for another call instead of running.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.calls = 0
+        self.shared = 0
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, func: Callable, *args, **kwargs) -> Any:
+        """Call a function, unless a call with the same key is already running, in which case
+        wait for that call instead.
+
+        Args:
+            key (Hashable): The key of the call.
+            func (Callable): The function to call.
+            *args: Positional arguments for func.
+            **kwargs: Keyword arguments for func.
+
+        Raises:
+            Exception: Any exception raised by the call, which is raised in every waiting caller.
+
+        Returns:
+            Any: The result of the call.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.calls += 1
+            else:
+                self.shared += 1
+        if not leader:
+            log.info("Waiting for the %s call in flight for %s", self.name, key)
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = func(*args, **kwargs)
+            return flight.result
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def stats(self) -> dict:
+        """Get the number of calls that ran and that were shared.
+
+        Returns:
+            dict: The calls, shared and in_flight counts.
+        """
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "shared": self.shared,
+                "in_flight": len(self._flights),
+            }
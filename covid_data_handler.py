@@ -1,20 +1,99 @@
 """ Caches and request COVID data from the GOV.UK Covid19 API
 
 Attributes:
-    internal_covid_data (dict): An internal cache for the latest
-        API request and its associated location and nation
+    COVID_CSV_COLUMNS (tuple): The csv columns needed to calculate the dashboard COVID data, in the
+        order new cases, hospital cases, cumulative deaths.
+    COVID_CACHE_SIZE (int): The maximum number of locations held in the internal COVID data cache.
+    COVID_CACHE_TTL (float): How long, in seconds, cached COVID data is used before it is updated.
+    MAX_CONCURRENT_REQUESTS (int): The maximum number of GOV.UK COVID API requests made at once.
+    MAX_DELTA_REQUESTS (int): The most single date requests an update can make to only request
+        the days since the cached COVID data. Updates that would need more make one request for
+        every date instead, which costs less.
+    DELTA_REVISION_DAYS (int): How many days before the latest cached date are requested again in
+        a delta update, since recent values are revised as more test results are reported. It
+        covers every day the 7 day sums add up, so the sums match a request for every date.
+    NATIONAL_CACHE_TTL (float): How long, in seconds, a national API response is shared between
+        local COVID data updates before it is requested again.
+    MAX_PENDING_AREAS (int): The most areas requested by users that are fetched at once. Areas
+        requested while that many are being fetched are not fetched.
+    UNKNOWN_AREA_TTL (float): How long, in seconds, an area the API has no local data for is
+        remembered, so it is not requested again.
+    internal_covid_data (TTLCache): An internal cache of processed COVID data, keyed on
+        (location, nation, location_type).
+    internal_national_data (TTLCache): An internal cache of national COVID data, keyed on nation.
+    internal_local_series (TTLCache): The full history of local COVID data, keyed on
+        (location, location_type), used to make delta updates.
+    covid_data_flight (SingleFlight): Coalesces concurrent updates of the same COVID data.
+    national_data_flight (SingleFlight): Coalesces concurrent requests for the same national data.
+    local_series_flight (SingleFlight): Coalesces concurrent requests for the same local data.
+    unknown_areas (TTLCache): Areas the API had no local data for, keyed on
+        (location, nation, location_type).
+    pending_areas (dict): The futures of areas requested by users that are being fetched, keyed on
+        (location, nation, location_type).
+    pending_areas_lock (Lock): Guards pending_areas.
+    request_pool (ThreadPoolExecutor): The thread pool GOV.UK COVID API requests are made on.
+    area_request_pool (ThreadPoolExecutor): The thread pool areas requested by users are fetched
+        on.
+    delta_request_pool (ThreadPoolExecutor): The thread pool requests for single dates are made on.
     log (Logger): The logger for the covid_dashboard.
 """
-from typing import Optional, Union
-from datetime import timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Union
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, timedelta
+from itertools import islice
+import csv
 import logging
+import threading
+import time
 import requests
 import uk_covid19
+from cache import SingleFlight, TTLCache
+from covid_series import CovidSeries
+from metrics import UPSTREAM_ERRORS, UPSTREAM_LATENCY, instrument, timed
+from storage import persistent_cache
+from upstream import get_upstream
+from utils import bump_area_version, bump_dashboard_version
 # from scheduler import schedule_event
 
+COVID_CSV_COLUMNS = (
+    "newCasesBySpecimenDate",
+    "hospitalCases",
+    "cumDailyNsoDeathsByDeathDate",
+)
+COVID_CACHE_SIZE = 256
+COVID_CACHE_TTL = timedelta(hours=24).total_seconds()
+NATIONAL_CACHE_TTL = timedelta(minutes=10).total_seconds()
+MAX_CONCURRENT_REQUESTS = 8
+MAX_DELTA_REQUESTS = 10
+DELTA_REVISION_DAYS = 8
+MAX_PENDING_AREAS = 4
+UNKNOWN_AREA_TTL = timedelta(minutes=10).total_seconds()
+
 log = logging.getLogger("covid_dashboard")
 log.info("Initialising empty internal covid data")
-internal_covid_data: dict = {"location": None, "nation": None, "data": None}
+internal_covid_data = TTLCache(
+    "COVID data", maxsize=COVID_CACHE_SIZE, ttl=COVID_CACHE_TTL
+)
+internal_national_data = TTLCache(
+    "national COVID data", maxsize=8, ttl=NATIONAL_CACHE_TTL
+)
+internal_local_series = TTLCache("local COVID series", maxsize=COVID_CACHE_SIZE)
+covid_data_flight = SingleFlight("COVID data")
+national_data_flight = SingleFlight("national COVID data")
+local_series_flight = SingleFlight("local COVID series")
+unknown_areas = TTLCache("unknown area", maxsize=COVID_CACHE_SIZE, ttl=UNKNOWN_AREA_TTL)
+pending_areas: Dict[tuple, Future] = {}
+pending_areas_lock = threading.Lock()
+request_pool = ThreadPoolExecutor(
+    max_workers=MAX_CONCURRENT_REQUESTS, thread_name_prefix="covid_api_request"
+)
+delta_request_pool = ThreadPoolExecutor(
+    max_workers=MAX_CONCURRENT_REQUESTS, thread_name_prefix="covid_api_delta_request"
+)
+area_request_pool = ThreadPoolExecutor(
+    max_workers=MAX_PENDING_AREAS, thread_name_prefix="covid_area_request"
+)
 
 
 def parse_csv_data(csv_filename: str) -> list:
@@ -29,13 +108,33 @@ def parse_csv_data(csv_filename: str) -> list:
     log.info("Parsing csv data in %s", csv_filename)
     rows = []
     with open(csv_filename, encoding="utf-8") as data:
-        file = data.read()
-        for line in file.split("\n"):
+        for line in data:
+            line = line.rstrip("\n")
             if line != "":
                 rows.append(line)
     return rows
 
 
+def read_csv_columns(csv_filename: str, columns: Sequence[str]) -> Iterator[dict]:
+    """Lazily reads a csv file one row at a time, only keeping the requested columns.
+
+    Args:
+        csv_filename (str): name of or path to csv file to read.
+        columns (Sequence[str]): titles of the columns to keep.
+
+    Yields:
+        dict: the value of each requested column in the next row.
+    """
+    log.info("Streaming columns %s from csv data in %s", columns, csv_filename)
+    with open(csv_filename, encoding="utf-8", newline="") as data:
+        reader = csv.reader(data)
+        column_titles = next(reader, [])
+        indexes = [column_titles.index(column) for column in columns]
+        for row in reader:
+            if row:
+                yield {column: row[index] for column, index in zip(columns, indexes)}
+
+
 def process_covid_csv_data(covid_csv_data: list) -> tuple:
     """Calculate the 7 day case total, current hospital cases, and total deaths.
 
@@ -55,23 +154,85 @@ def process_covid_csv_data(covid_csv_data: list) -> tuple:
     hospital_cases_column = column_titles.index("hospitalCases")
     new_cases_column = column_titles.index("newCasesBySpecimenDate")
 
-    # Split each line after the first by ","
-    data = []
-    for line in covid_csv_data[1:]:
-        data.append(line.split(","))
+    # Lazily split each line after the first by ",", only as far as is needed
+    data = (line.split(",") for line in islice(covid_csv_data, 1, None))
+    return summarise_covid_rows(
+        data, new_cases_column, hospital_cases_column, deaths_column
+    )
+
+
+def process_covid_csv_file(csv_filename: str) -> tuple:
+    """Calculate the 7 day case total, current hospital cases, and total deaths directly from a csv
+    file. The file is streamed and reading stops as soon as every value is known, so the size of
+    the file does not matter.
+
+    Args:
+        csv_filename (str): name of or path to csv file from the GOV.UK COVID19 API.
+
+    Returns:
+        tuple: containing,
+            cases_in_seven_days(int): Total cases in the last 7 days.
+            current_hospitcal_cases(int): Current number of hospital cases.
+            cumulative_deaths(int): Total deaths.
+    """
+    log.info("Processing csv data in %s", csv_filename)
+    rows = read_csv_columns(csv_filename, COVID_CSV_COLUMNS)
+    try:
+        return summarise_covid_rows(rows, *COVID_CSV_COLUMNS)
+    finally:
+        rows.close()
+
+
+def summarise_covid_rows(
+    rows: Iterable,
+    new_cases_key: Union[str, int],
+    hospital_cases_key: Union[str, int],
+    deaths_key: Union[str, int],
+) -> tuple:
+    """Calculate the 7 day case total, current hospital cases, and total deaths in a single pass
+    over rows of data. Rows are only read until every value is known, and only one row is held in
+    memory at a time, even if a column has no valid values.
 
-    cases_in_seven_days = sum_7days(data, new_cases_column)
-    current_hospital_cases = first_value(data, hospital_cases_column)
-    cumulative_deaths = first_value(data, deaths_column)
+    Args:
+        rows (Iterable): Rows of data, most recent first, where each row contains indexable data.
+        new_cases_key (str | int): Index of the new cases in each row.
+        hospital_cases_key (str | int): Index of the hospital cases in each row.
+        deaths_key (str | int): Index of the cumulative deaths in each row.
+
+    Returns:
+        tuple: containing,
+            cases_in_seven_days(int): Total cases in the last 7 days.
+            current_hospitcal_cases(int): Current number of hospital cases.
+            cumulative_deaths(int): Total deaths.
+    """
+    # The same calculation as sum_7days and first_value, updated one row at a time
+    cases_in_seven_days = 0
+    days_summed = 0
+    current_hospital_cases = cumulative_deaths = None
+    for row in rows:
+        if days_summed < 8:
+            cases = row[new_cases_key]
+            if days_summed > 0:
+                cases_in_seven_days += int(cases)
+                days_summed += 1
+            elif cases not in [None, ""]:
+                # Skip the first valid value, since the most recent day is usually incomplete
+                days_summed = 1
+        if current_hospital_cases is None and row[hospital_cases_key] not in [None, ""]:
+            current_hospital_cases = int(row[hospital_cases_key])
+        if cumulative_deaths is None and row[deaths_key] not in [None, ""]:
+            cumulative_deaths = int(row[deaths_key])
+        if days_summed == 8 and None not in (current_hospital_cases, cumulative_deaths):
+            break
 
     return (cases_in_seven_days, current_hospital_cases, cumulative_deaths)
 
 
-def sum_7days(days: list, key: Union[str, int], skip_first: bool = True) -> int:
+def sum_7days(days: Iterable, key: Union[str, int], skip_first: bool = True) -> int:
     """Iterates over and sums the first 7 days worth of a specified value.
 
     Args:
-        days (list): List of days, where each day contains indexable data.
+        days (Iterable): Days, where each day contains indexable data.
         key (str | int): Index of data that should be summed.
         skip_first (bool, optional): If first valid data value should be skipped. Defaults to True.
 
@@ -86,10 +247,10 @@ def sum_7days(days: list, key: Union[str, int], skip_first: bool = True) -> int:
         if index == limit:
             break
         # Otherwise, skip if the value is not valid AND we have not started summing yet
-        if (day[key] in [None, ""]) & (index == 0):
+        if day[key] in [None, ""] and index == 0:
             continue
         # Otherwise, skip the first valid value
-        if index == 0 & skip_first:
+        if index == 0 and skip_first:
             index += 1
         # Sum the value, even if it's not valid. This avoids a bug that would occur if one of the
         # values included in the 7 day total is an empty string
@@ -99,11 +260,11 @@ def sum_7days(days: list, key: Union[str, int], skip_first: bool = True) -> int:
     return total
 
 
-def first_value(rows: list, column: Union[str, int]) -> Optional[int]:
+def first_value(rows: Iterable, column: Union[str, int]) -> Optional[int]:
     """Get the first valid value in a row.
 
     Args:
-        rows (list): Rows of data, where one of the rows has invalid leading values.
+        rows (Iterable): Rows of data, where one of the rows has invalid leading values.
         column (str | int): Index of column that should be verified.
 
     Returns:
@@ -117,16 +278,19 @@ def first_value(rows: list, column: Union[str, int]) -> Optional[int]:
     return result
 
 
+@timed(UPSTREAM_LATENCY, upstream="covid_api")
 def covid_api_request(
-    location: str = "Exeter", location_type: str = "ltla"
+    location: str = "Exeter", location_type: str = "ltla", day: Optional[str] = None
 ) -> Optional[dict]:
-    """Makes a request to the GOV.UK COVID API.
+    """Makes a request to the GOV.UK COVID API, or the upstream that replaces it.
 
     Args:
         location (str, optional): Location name. See API developer guide for possible values.
             Defaults to "Exeter".
         location_type (str, optional): Location type. See API developer guide for possible values.
             Defaults to "ltla".
+        day (Optional[str], optional): Only request data for this date, formatted as YYYY-MM-DD.
+            Defaults to None, which requests every date.
 
     Returns:
         Optional[dict]: Response data.
@@ -137,6 +301,8 @@ def covid_api_request(
         location_type,
     )
     location_filter = ["areaType=" + location_type, "areaName=" + location]
+    if day is not None:
+        location_filter.append("date=" + day)
 
     data_structure = {
         "date": "date",
@@ -146,22 +312,25 @@ def covid_api_request(
     }
 
     try:
-        api = uk_covid19.Cov19API(filters=location_filter, structure=data_structure)
-        response = api.get_json()
+        response = get_upstream().covid(location_filter, data_structure)
         log.info("Received COVID19 API response")
         return response
     except uk_covid19.exceptions.FailedRequestError:
         log.error("FailedRequestError from COVID19 API request")
+        UPSTREAM_ERRORS.inc(upstream="covid_api")
         return None
     except requests.exceptions.RequestException:
         log.error("RequestException from COVID19 API request")
+        UPSTREAM_ERRORS.inc(upstream="covid_api")
         return None
 
 
+@instrument
 def get_covid_data(
     location: str, nation: str, location_type: str = "ltla", force_update: bool = False
 ) -> Optional[dict]:
-    """Gets internal cached COVID data based on the GOV.UK COVID API.
+    """Gets internal cached COVID data based on the GOV.UK COVID API. Concurrent updates of the
+    same data are coalesced into one, which every caller waits for.
 
     Args:
         location (str): Location name. See API developer guide for possible values.
@@ -174,35 +343,329 @@ def get_covid_data(
     Returns:
         dict: COVID data.
     """
-    # IF LOCATION/NATION HAS CHANGED OR DATA IS NONE UPDATE_COVID_DATA
+    # IF THERE IS NO FRESH DATA FOR THIS LOCATION/NATION OR AN UPDATE IS FORCED UPDATE_COVID_DATA
     log.info("Getting COVID data")
-    if internal_covid_data["location"] != location:
+    key = (location, nation, location_type)
+    if force_update:
+        log.info("Forcing an update of COVID data for %s, %s", location, nation)
+    else:
+        cached = internal_covid_data.get(key)
+        if cached is not None:
+            log.info("Using cached COVID data for %s, %s", location, nation)
+            return cached
+        log.info("No fresh cached data exists for %s, %s", location, nation)
+    return covid_data_flight.do(key, refresh_covid_data, key, force_update)
+
+
+def find_covid_data(
+    location: str, nation: str, location_type: str = "ltla"
+) -> Optional[dict]:
+    """Gets the cached COVID data of an area requested by a user, without waiting for the API.
+    Stale data is returned and updated in the background. An area that is not cached is fetched in
+    the background, at most MAX_PENDING_AREAS at a time, and is only cached if the API has local
+    data for it, so made up area names are never cached, persisted or refreshed.
+
+    Args:
+        location (str): Location name. See API developer guide for possible values.
+        nation (str): Nation name. See API developer guide for possible values.
+        location_type (str, optional): Location type. See API developer guide for possible values.
+            Defaults to "ltla".
+
+    Returns:
+        Optional[dict]: COVID data, or None if the area is being fetched or is unknown.
+    """
+    key = (location, nation, location_type)
+    cached = internal_covid_data.get(key)
+    if cached is not None:
+        return cached
+    if is_unknown_area(location, nation, location_type):
+        return None
+    with pending_areas_lock:
+        if key in pending_areas:
+            return internal_covid_data.peek(key)
+        if len(pending_areas) >= MAX_PENDING_AREAS:
+            log.warning("Not fetching COVID data for %s, %s, too many areas pending", *key[:2])
+            return internal_covid_data.peek(key)
+        log.info("Fetching COVID data for %s, %s in the background", location, nation)
+        future = pending_areas[key] = area_request_pool.submit(_request_area, key)
+    # Added outside the lock, since it is called straight away if the fetch has already finished
+    future.add_done_callback(lambda _: _finish_area(key))
+    return internal_covid_data.peek(key)
+
+
+def is_unknown_area(location: str, nation: str, location_type: str = "ltla") -> bool:
+    """Check if the API recently had no local data for an area.
+
+    Args:
+        location (str): Location name.
+        nation (str): Nation name.
+        location_type (str, optional): Location type. Defaults to "ltla".
+
+    Returns:
+        bool: If the area is unknown.
+    """
+    return unknown_areas.get((location, nation, location_type)) is not None
+
+
+def _request_area(key: tuple) -> Optional[dict]:
+    data = update_covid_data(*key)
+    if data is None:
+        # A failed request says nothing about the area, so it is requested again next time
+        return None
+    local = internal_local_series.peek((key[0], key[2]))
+    # Only a successful request with no records means the API does not know the area
+    if internal_covid_data.peek(key) is None and local is not None and not local.dates:
+        log.warning("No local COVID data for %s, %s, not caching it", *key[:2])
+        unknown_areas.set(key, True)
+        return None
+    store_covid_data(key, data)
+    bump_area_version(key)
+    return data
+
+
+def _finish_area(key: tuple) -> None:
+    with pending_areas_lock:
+        pending_areas.pop(key, None)
+
+
+def refresh_covid_data(key: tuple, force_update: bool = False) -> Optional[dict]:
+    """Update the internal cached COVID data for a location, then persist it.
+
+    Args:
+        key (tuple): The location, nation and location_type.
+        force_update (bool, optional): Update even if another caller has just cached fresh data.
+            Defaults to False.
+
+    Returns:
+        Optional[dict]: COVID data. If the update failed, the stale cached data, or None if there
+            is none.
+    """
+    if not force_update:
+        # Another caller may have finished an update since this caller missed the cache
+        cached = internal_covid_data.get(key)
+        if cached is not None:
+            return cached
+    data = update_covid_data(*key)
+    if data is None:
+        return internal_covid_data.peek(key)
+    store_covid_data(key, data)
+    bump_area_version(key)
+    return data
+
+
+def store_covid_data(key: tuple, data: dict) -> None:
+    """Cache and persist COVID data, keeping at most COVID_CACHE_SIZE locations persisted.
+
+    Args:
+        key (tuple): The location, nation and location_type.
+        data (dict): COVID data.
+    """
+    internal_covid_data.set(key, data)
+    persistent_cache.save("covid", key, data)
+    persistent_cache.prune("covid", COVID_CACHE_SIZE)
+
+
+def cached_covid_areas(extra_keys: Iterable[tuple] = ()) -> Dict[tuple, List[str]]:
+    """Get every cached location, grouped by the nation and location_type they share a national
+    request with.
+
+    Args:
+        extra_keys (Iterable[tuple], optional): The location, nation and location_type of
+            locations to include even if they are not cached, such as the configured location.
+            Defaults to ().
+
+    Returns:
+        dict[tuple, list[str]]: The locations of each (nation, location_type).
+    """
+    keys = dict.fromkeys([*map(tuple, extra_keys), *internal_covid_data.keys()])
+    groups = defaultdict(list)
+    for location, nation, location_type in keys:
+        groups[(nation, location_type)].append(location)
+    return dict(groups)
+
+
+def refresh_covid_area(locations: Iterable[str], nation: str, location_type: str = "ltla") -> int:
+    """Update the COVID data of many locations in the same nation at once. They share one national
+    request, which is made again rather than taken from the cache.
+
+    Args:
+        locations (Iterable[str]): Location names. See API developer guide for possible values.
+        nation (str): Nation name. See API developer guide for possible values.
+        location_type (str, optional): Location type. See API developer guide for possible values.
+            Defaults to "ltla".
+
+    Returns:
+        int: The number of locations updated.
+    """
+    results = update_covid_data_batch(locations, nation, location_type, force_update=True)
+    for location, data in results.items():
+        store_covid_data((location, nation, location_type), data)
+        bump_area_version((location, nation, location_type))
+    return len(results)
+
+
+def refresh_cached_covid_data(extra_keys: Iterable[tuple] = ()) -> int:
+    """Update the COVID data of every cached location, one nation at a time.
+
+    Args:
+        extra_keys (Iterable[tuple], optional): The location, nation and location_type of
+            locations to update even if they are not cached, such as the configured location.
+            Defaults to ().
+
+    Returns:
+        int: The number of locations updated.
+    """
+    groups = cached_covid_areas(extra_keys)
+    log.info("Refreshing COVID data for %s nations", len(groups))
+    return sum(
+        refresh_covid_area(locations, nation, location_type)
+        for (nation, location_type), locations in groups.items()
+    )
+
+
+def load_persisted_covid_data() -> int:
+    """Load the COVID data saved in the persistent cache into the internal COVID data cache, so
+    it can be used before it is updated. Each entry only stays fresh for what is left of
+    COVID_CACHE_TTL since it was saved, so old entries are stale and updated when next used.
+
+    Returns:
+        int: The number of locations loaded.
+    """
+    entries = persistent_cache.load_all("covid")
+    now = time.time()
+    for key, data, saved_at in entries:
+        internal_covid_data.set(tuple(key), data, ttl=max(COVID_CACHE_TTL - (now - saved_at), 0))
+    log.info("Loaded persisted COVID data for %s locations", len(entries))
+    bump_dashboard_version()
+    return len(entries)
+
+
+def get_national_data(nation: str, force_update: bool = False) -> Optional[CovidSeries]:
+    """Gets the cached national COVID data from the GOV.UK COVID API, which is shared between every
+    location in the same nation.
+
+    Args:
+        nation (str): Nation name. See API developer guide for possible values.
+        force_update (bool, optional): Ignore the cached data and force a new request.
+            Defaults to False.
+
+    Returns:
+        Optional[CovidSeries]: National COVID data, or None if the request failed.
+    """
+    if not force_update:
+        cached = internal_national_data.get(nation)
+        if cached is not None:
+            log.info("Using cached national COVID data for %s", nation)
+            return cached
+    return national_data_flight.do(nation, _request_national_data, nation)
+
+
+def _request_national_data(nation: str) -> Optional[CovidSeries]:
+    national = covid_api_series(nation, "Nation", internal_national_data.peek(nation))
+    # Failed requests are not cached so the next update tries again
+    if national is not None:
+        internal_national_data.set(nation, national)
+    return national
+
+
+def get_local_series(location: str, location_type: str = "ltla") -> Optional[CovidSeries]:
+    """Updates the full history of local COVID data, only requesting recent days if it has been
+    requested before.
+
+    Args:
+        location (str): Location name. See API developer guide for possible values.
+        location_type (str, optional): Location type. See API developer guide for possible values.
+            Defaults to "ltla".
+
+    Returns:
+        Optional[CovidSeries]: Local COVID data, or None if the request failed.
+    """
+    return local_series_flight.do(
+        (location, location_type), _request_local_series, location, location_type
+    )
+
+
+def _request_local_series(location: str, location_type: str) -> Optional[CovidSeries]:
+    key = (location, location_type)
+    local = covid_api_series(location, location_type, internal_local_series.peek(key))
+    if local is not None:
+        internal_local_series.set(key, local)
+    return local
+
+
+def covid_api_series(
+    location: str, location_type: str = "ltla", previous: Optional[CovidSeries] = None
+) -> Optional[CovidSeries]:
+    """Makes a request to the GOV.UK COVID API and stores the response as a CovidSeries. If the
+    previous data is recent enough, only the days since it, and the days that may have been
+    revised, are requested and merged into it.
+
+    Args:
+        location (str): Location name. See API developer guide for possible values.
+        location_type (str, optional): Location type. See API developer guide for possible values.
+            Defaults to "ltla".
+        previous (Optional[CovidSeries], optional): Previously requested data for the location.
+            Defaults to None.
+
+    Returns:
+        Optional[CovidSeries]: COVID data, or None if the request failed.
+    """
+    if previous is not None and previous.dates and previous.dates[0]:
+        latest = date.fromisoformat(previous.dates[0])
+        days_behind = (date.today() - latest).days
+        # A delta update requests each date since the latest cached date, and the revised days
+        if days_behind + DELTA_REVISION_DAYS + 1 <= MAX_DELTA_REQUESTS:
+            return covid_api_delta(location, location_type, previous, latest)
         log.info(
-            "Cached location %s does not match" " requested location %s",
-            internal_covid_data["location"],
+            "Cached COVID data for %s is %s days old, requesting every date",
             location,
+            days_behind,
         )
-    elif internal_covid_data["nation"] != nation:
-        log.info(
-            "Cached nation %s does not match requested" " nation %s",
-            internal_covid_data["nation"],
-            nation,
+    response = covid_api_request(location, location_type)
+    if response is None:
+        return None
+    return CovidSeries.from_records(response["data"])
+
+
+def covid_api_delta(
+    location: str, location_type: str, previous: CovidSeries, latest: date
+) -> CovidSeries:
+    """Requests only the recent days of COVID data for a location, and merges them into the
+    previously requested data.
+
+    Args:
+        location (str): Location name. See API developer guide for possible values.
+        location_type (str): Location type. See API developer guide for possible values.
+        previous (CovidSeries): Previously requested data for the location.
+        latest (date): The most recent date in the previous data.
+
+    Returns:
+        CovidSeries: The merged COVID data. If any request fails, the previous data is returned
+            unchanged.
+    """
+    first = latest - timedelta(days=DELTA_REVISION_DAYS)
+    days = [
+        (date.today() - timedelta(days=offset)).isoformat()
+        for offset in range((date.today() - first).days + 1)
+    ]
+    log.info("Requesting %s recent days of COVID data for %s", len(days), location)
+    responses = list(
+        delta_request_pool.map(
+            lambda day: covid_api_request(location, location_type, day), days
         )
-    elif not internal_covid_data["data"]:
-        log.info("No cached data exists for %s, %s", location, nation)
-    elif force_update:
-        log.info("Forcing an update of COVID data")
-    else:
-        log.info("Using cached COVID data for %s, %s", location, nation)
-        return internal_covid_data["data"]
-    internal_covid_data["location"] = location
-    internal_covid_data["nation"] = nation
-    internal_covid_data["data"] = update_covid_data(location, nation, location_type)
-    return internal_covid_data["data"]
+    )
+    if any(response is None for response in responses):
+        log.warning("Delta update for %s failed, keeping the previous data", location)
+        return previous
+    records = [record for response in responses for record in response["data"]]
+    return previous.merge(CovidSeries.from_records(records))
 
 
-def update_covid_data(location: str, nation: str, location_type: str = "ltla") -> dict:
-    """Update the cached COVID data with new values from the API.
+def update_covid_data(
+    location: str, nation: str, location_type: str = "ltla"
+) -> Optional[dict]:
+    """Update the cached COVID data with new values from the API. The local and national requests
+    are made concurrently.
 
     Args:
         location (str): Location name. See API developer guide for possible values.
@@ -211,22 +674,80 @@ def update_covid_data(location: str, nation: str, location_type: str = "ltla") -
             Defaults to "ltla".
 
     Returns:
-        dict: COVID data.
+        Optional[dict]: COVID data, or None if the update failed.
     """
-    local = covid_api_request(location, location_type)
-    national = covid_api_request(nation, "Nation")
+    return update_covid_data_batch([location], nation, location_type).get(location)
 
-    try:
-        local_7day = sum_7days(local["data"], "newCasesBySpecimenDate")
-    except TypeError:
-        local_7day = None
 
+def update_covid_data_batch(
+    locations: Iterable[str],
+    nation: str,
+    location_type: str = "ltla",
+    force_update: bool = False,
+) -> Dict[str, dict]:
+    """Update COVID data for many locations in the same nation. Every local request and the shared
+    national request are made concurrently, at most MAX_CONCURRENT_REQUESTS at a time.
+
+    Args:
+        locations (Iterable[str]): Location names. See API developer guide for possible values.
+        nation (str): Nation name. See API developer guide for possible values.
+        location_type (str, optional): Location type. See API developer guide for possible values.
+            Defaults to "ltla".
+        force_update (bool, optional): Request the national data again even if it is cached.
+            Defaults to False.
+
+    Returns:
+        dict[str, dict]: COVID data for each location. Locations whose local request failed are
+            left out, so their cached data is kept. If the national request failed, the last
+            national data is used, even if it is stale.
+    """
+    national_request = request_pool.submit(get_national_data, nation, force_update)
+    local_requests = {
+        location: request_pool.submit(get_local_series, location, location_type)
+        for location in dict.fromkeys(locations)
+    }
     try:
-        national_7day = sum_7days(national["data"], "newCasesBySpecimenDate")
-        hospital = first_value(national["data"], "hospitalCases")
-        deaths = first_value(national["data"], "cumDailyNsoDeathsByDeathDate")
-    except TypeError:
-        national_7day = hospital = deaths = None
+        national = national_request.result()
+    except Exception:  # pylint: disable=broad-except
+        log.exception("National COVID data update for %s failed", nation)
+        national = None
+    if national is None:
+        log.warning("Using the last national COVID data for %s", nation)
+        national = internal_national_data.peek(nation)
+    results = {}
+    for location, request in local_requests.items():
+        # One failed location does not stop the others being updated
+        try:
+            local = request.result()
+        except Exception:  # pylint: disable=broad-except
+            log.exception("COVID data update for %s failed, keeping the cached data", location)
+            continue
+        if local is None:
+            log.warning("COVID data request for %s failed, keeping the cached data", location)
+            continue
+        results[location] = process_covid_series(local, national)
+    return results
+
+
+def process_covid_series(
+    local: Optional[CovidSeries], national: Optional[CovidSeries]
+) -> dict:
+    """Calculate the dashboard COVID data from local and national COVID data.
+
+    Args:
+        local (Optional[CovidSeries]): Local COVID data, or None if the request failed.
+        national (Optional[CovidSeries]): National COVID data, or None if the request failed.
+
+    Returns:
+        dict: COVID data.
+    """
+    local_7day = national_7day = hospital = deaths = None
+    if local is not None:
+        local_7day = local.sum_7days("newCasesBySpecimenDate")
+    if national is not None:
+        national_7day = national.sum_7days("newCasesBySpecimenDate")
+        hospital = national.latest_valid("hospitalCases")
+        deaths = national.latest_valid("cumDailyNsoDeathsByDeathDate")
 
     covid_data = {
         "local_7day": local_7day,
@@ -237,6 +758,20 @@ def update_covid_data(location: str, nation: str, location_type: str = "ltla") -
     return covid_data
 
 
+def covid_csv_series(csv_filename: str) -> CovidSeries:
+    """Load the full history of a GOV.UK COVID API csv file into a CovidSeries.
+
+    Args:
+        csv_filename (str): name of or path to csv file to load.
+
+    Returns:
+        CovidSeries: COVID data.
+    """
+    return CovidSeries.from_records(
+        read_csv_columns(csv_filename, ("date",) + COVID_CSV_COLUMNS)
+    )
+
+
 def schedule_covid_updates(update_interval: int, update_name: str) -> None:
     """Wrapper function for scheduler module to schedule update.
 
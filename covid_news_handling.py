@@ -1,23 +1,55 @@
 """ Deals with the dashboard news and all of its related API requests.
 
 Attributes:
+    COVID_TERMS (str): The default news article search terms.
     news (list): A list of all the current dashboard news.
+    news_terms (Optional[str]): The search terms of the current dashboard news.
+    NEWS_LIMIT (int): The maximum number of news articles requested and kept.
+    NEWS_REQUEST_TIMEOUT (float): How many seconds to wait for NewsAPI.org to respond.
+    news_lock (Lock): Held while news and news_terms are replaced, so they always match.
+    news_flight (SingleFlight): Coalesces concurrent news updates for the same search terms.
     log (Logger): The logger for the covid_dashboard.
 """
 import logging
+import threading
+from datetime import datetime
+from typing import Optional
 import requests
-from utils import get_setting, get_news_blacklist, blacklist, sanitise_input
+from flask import Markup
+from cache import SingleFlight
+from metrics import UPSTREAM_ERRORS, UPSTREAM_LATENCY, instrument, timed
+from storage import persistent_cache
+from upstream import NEWS_API_URL, get_upstream
+from utils import (
+    blacklist,
+    bump_dashboard_version,
+    get_setting,
+    news_blacklist,
+    sanitise_input,
+)
 
+COVID_TERMS = "Covid COVID-19 coronavirus"
 news: list = []
+news_terms: Optional[str] = None
+NEWS_LIMIT = 100
+NEWS_REQUEST_TIMEOUT = 30
+news_lock = threading.Lock()
+news_flight = SingleFlight("news")
 log = logging.getLogger("covid_dashboard")
 
 
-def news_API_request(covid_terms: str = "Covid COVID-19 coronavirus") -> list:
-    """Sends an API request to NewsAPI.org for news articles that include covid_terms.
+@timed(UPSTREAM_LATENCY, upstream="news_api")
+def news_API_request(
+    covid_terms: str = COVID_TERMS, published_from: Optional[str] = None
+) -> list:
+    """Sends an API request to NewsAPI.org, or the upstream that replaces it, for news articles
+    that include covid_terms.
 
     Args:
         covid_terms (str, optional): News article search terms.
-            Defaults to "Covid COVID-19 coronavirus".
+            Defaults to COVID_TERMS.
+        published_from (Optional[str], optional): Only request articles published at or after
+            this ISO 8601 time. Defaults to None.
 
     Returns:
         List[dict]: A list of news article dictionaries. Read the full documentation on NewsAPI.org
@@ -26,11 +58,14 @@ def news_API_request(covid_terms: str = "Covid COVID-19 coronavirus") -> list:
     log.info("Making NewsAPI.org request")
     api_key = get_setting("api_key")
     url = (
-        f"https://newsapi.org/v2/everything?q={covid_terms}"
-        f"&apiKey={api_key}&sortBy=PublishedAt&pageSize=100&language=en"
+        f"{NEWS_API_URL}?q={covid_terms}"
+        f"&apiKey={api_key}&sortBy=PublishedAt&pageSize={NEWS_LIMIT}&language=en"
     )
+    if published_from is not None:
+        log.info("Requesting articles published from %s", published_from)
+        url += f"&from={published_from}"
     try:
-        response = requests.get(url)
+        response = get_upstream().news(url, NEWS_REQUEST_TIMEOUT)
         if response.status_code == 200:
             log.info("Received response from NewsAPI.org")
             articles = response.json()["articles"]
@@ -38,6 +73,7 @@ def news_API_request(covid_terms: str = "Covid COVID-19 coronavirus") -> list:
             log.error(
                 "NewsAPI.org request failed, %s - %s", response.status_code, response.reason
             )
+            UPSTREAM_ERRORS.inc(upstream="news_api")
             if response.status_code == 401:
                 log.warning(
                     "Have you supplied a valid NewsAPI.org API key in config.json?"
@@ -46,25 +82,25 @@ def news_API_request(covid_terms: str = "Covid COVID-19 coronavirus") -> list:
 
     except requests.exceptions.RequestException:
         log.error("RequestException for NewsAPI.org request")
+        UPSTREAM_ERRORS.inc(upstream="news_api")
         articles = []
     return articles
 
 
 def get_news(
-    covid_terms: str = "Covid COVID-19 coronavirus", force_update: bool = False
+    covid_terms: str = COVID_TERMS, force_update: bool = False
 ) -> list:
     """Gets the internal cached news, and if that does not exist or an update is forced, makes a
     request to NewsAPI.org.
 
     Args:
         covid_terms (str, optional): News article search terms.
-            Defaults to "Covid COVID-19 coronavirus".
+            Defaults to COVID_TERMS.
         force_update (bool, optional): Force an update to the news articles. Defaults to False.
 
     Returns:
         list: A list of news article dictionaries.
     """
-    global news
     log.info("Reqest to get news with covid_terms = %s", covid_terms)
     if not news:
         log.info("No cached news exists")
@@ -73,42 +109,139 @@ def get_news(
     else:
         log.info("Using cached news data")
         return news
-    news = update_news(covid_terms)
+    return news_flight.do(covid_terms, refresh_news, covid_terms)
+
+
+def refresh_news(covid_terms: str = COVID_TERMS) -> list:
+    """Update the internal cached news from NewsAPI.org, then persist it.
+
+    Args:
+        covid_terms (str, optional): News article search terms.
+            Defaults to COVID_TERMS.
+
+    Returns:
+        list: A list of news article dictionaries.
+    """
+    global news, news_terms
+    # Only request newer articles if the cached news is for the same search terms
+    current_news, current_terms = news, news_terms
+    updated = update_news(covid_terms, current_news if current_terms == covid_terms else None)
+    with news_lock:
+        # Articles removed while the request was in flight are not added back
+        news = [article for article in updated if article["title"] not in news_blacklist]
+        news_terms = covid_terms
+        persistent_cache.save("news", covid_terms, news)
+    bump_dashboard_version()
     return news
 
 
-def update_news(covid_terms: str = "Covid COVID-19 coronavirus") -> list:
+def load_persisted_news(covid_terms: str = COVID_TERMS) -> bool:
+    """Load the news saved in the persistent cache, so it can be used before it is updated.
+
+    Args:
+        covid_terms (str, optional): News article search terms.
+            Defaults to COVID_TERMS.
+
+    Returns:
+        bool: If any news was loaded.
+    """
+    global news, news_terms
+    persisted = persistent_cache.load("news", covid_terms)
+    if persisted is None or not persisted[0]:
+        log.info("No persisted news exists for covid_terms = %s", covid_terms)
+        return False
+    # Markup is saved as a plain string, so the content is rendered again
+    articles = [render_article(article) for article in persisted[0]]
+    with news_lock:
+        news, news_terms = articles, covid_terms
+    log.info("Loaded %s persisted news articles", len(news))
+    bump_dashboard_version()
+    return True
+
+
+@instrument
+def update_news(
+    covid_terms: str = COVID_TERMS, current_news: Optional[list] = None
+) -> list:
     """Parses the NewsAPI.org response for useful data such as the title, description and
     time of publishing.
 
     Args:
         covid_terms (str, optional): News article search terms.
-            Defaults to "Covid COVID-19 coronavirus".
+            Defaults to COVID_TERMS.
+        current_news (Optional[list], optional): The current news for covid_terms. If given, only
+            articles published since the latest current article are requested and merged into
+            it. Defaults to None.
 
     Returns:
         list:  A list of news article dictionaries.
     """
     result = []
-    users_blacklist = get_news_blacklist()
-    new_news = news_API_request(covid_terms)
+    published_from = None
+    if current_news:
+        published_from = max(article["publishedAt"] for article in current_news)
+    new_news = news_API_request(covid_terms, published_from)
     if new_news is not None:
         for article in new_news:
-            if article["title"] not in users_blacklist:
+            if article["title"] not in news_blacklist:
                 if article["title"] is not None:
                     title = sanitise_input(article["title"])
                 if article["description"] is not None:
                     description = sanitise_input(article["description"])
                 result.append(
-                    {
-                        "title": title,
-                        "description": description,
-                        "url": article["url"],
-                        "publishedAt": article["publishedAt"],
-                    }
+                    render_article(
+                        {
+                            "title": title,
+                            "description": description,
+                            "url": article["url"],
+                            "publishedAt": article["publishedAt"],
+                        }
+                    )
                 )
+    if current_news:
+        result = merge_news(result, current_news)
     return result
 
 
+def render_article(article: dict) -> dict:
+    """Render the HTML shown in the body of a news article on the dashboard, so it does not need
+    to be rendered again on every request.
+
+    Args:
+        article (dict): A news article dictionary.
+
+    Returns:
+        dict: The same news article dictionary, with its rendered "content".
+    """
+    time = datetime.strptime(article["publishedAt"], "%Y-%m-%dT%H:%M:%S%z")
+    article["content"] = Markup(
+        f"<u>{time.strftime('%I:%M %p %d/%m/%y')}</u><br>{article['description']} <a"
+        f" href='{article['url']}' target='_blank'>Read More.</a>"
+    )
+    return article
+
+
+def merge_news(new_news: list, current_news: list) -> list:
+    """Merge newly requested articles into the current news, removing duplicate URLs.
+
+    Args:
+        new_news (list): Newly requested news article dictionaries.
+        current_news (list): The current news article dictionaries.
+
+    Returns:
+        list: At most NEWS_LIMIT articles, most recently published first. Where two articles have
+            the same URL, the newly requested one is kept.
+    """
+    merged = {}
+    for article in new_news + current_news:
+        merged.setdefault(article["url"], article)
+    log.info("Merged %s new articles into %s articles", len(new_news), len(current_news))
+    articles = sorted(
+        merged.values(), key=lambda article: article["publishedAt"], reverse=True
+    )
+    return articles[:NEWS_LIMIT]
+
+
 def remove_article(title: str) -> None:
     """Remove an article and blacklist its title.
 
@@ -117,5 +250,10 @@ def remove_article(title: str) -> None:
     """
     log.info("Removing article title = %s", title)
     global news
-    news[:] = [article for article in news if article["title"] != title]
     blacklist(title)
+    # The list is replaced rather than changed in place, so readers never see it half changed
+    with news_lock:
+        news = [article for article in news if article["title"] != title]
+        if news_terms is not None:
+            persistent_cache.save("news", news_terms, news)
+    bump_dashboard_version()
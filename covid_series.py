@@ -0,0 +1,340 @@
+""" A columnar store for COVID time series data, where each metric is held as a typed array with a
+mask of missing values so that aggregates can be calculated in bulk rather than row by row.
+
+Attributes:
+    METRICS (tuple): The COVID metrics held by each series.
+    NAN (float): The value of windowed averages and changes that cannot be calculated.
+"""
+from array import array
+from itertools import accumulate, repeat
+from operator import mul, sub
+from typing import Dict, Iterable, Optional
+
+METRICS = (
+    "newCasesBySpecimenDate",
+    "hospitalCases",
+    "cumDailyNsoDeathsByDeathDate",
+)
+NAN = float("nan")
+
+
+def _is_valid(value) -> bool:
+    return value not in (None, "")
+
+
+def _to_int(value) -> int:
+    return 0 if value in (None, "") else int(value)
+
+
+def _divide(numerator: float, denominator: float) -> float:
+    return numerator / denominator if denominator else NAN
+
+
+class CovidSeries:
+    """COVID data for a single area, stored in columns ordered from the most recent day.
+
+    Missing values are stored as 0 in their metric array, with a 0 in the matching position of
+    the metrics mask, so sums treat them as 0 and lookups of valid values can skip them.
+
+    Attributes:
+        dates (list): The date of each day, as an ISO 8601 string.
+        values (dict[str, array]): A signed 64 bit integer array for each metric.
+        masks (dict[str, bytearray]): 1 where the matching value is present, 0 where it is missing.
+    """
+
+    __slots__ = ("dates", "values", "masks", "_prefix_sums", "_valid_prefix_sums")
+
+    def __init__(
+        self,
+        dates: Iterable[str],
+        values: Dict[str, array],
+        masks: Dict[str, bytearray],
+    ) -> None:
+        self.dates = list(dates)
+        self.values = values
+        self.masks = masks
+        self._prefix_sums: Dict[str, array] = {}
+        self._valid_prefix_sums: Dict[str, array] = {}
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict]) -> "CovidSeries":
+        """Build a series from rows of data, such as the "data" of a GOV.UK COVID API response or
+        the rows of a csv file.
+
+        Args:
+            records (Iterable[dict]): Rows of data, most recent first, keyed by "date" and metric.
+                They are read in one pass, so only one row is held in memory at a time.
+
+        Returns:
+            CovidSeries: The series.
+        """
+        dates = []
+        values = {metric: array("q") for metric in METRICS}
+        masks = {metric: bytearray() for metric in METRICS}
+        columns = [(metric, values[metric].append, masks[metric].append) for metric in METRICS]
+        for record in records:
+            dates.append(record.get("date"))
+            for metric, append_value, append_mask in columns:
+                value = record.get(metric)
+                append_value(_to_int(value))
+                append_mask(_is_valid(value))
+        return cls(dates, values, masks)
+
+    def merge(self, newer: "CovidSeries") -> "CovidSeries":
+        """Merge a series of recent days into this series. Days in both series take their values
+        from the newer series, since recent values are often revised. Days of this series missing
+        from the newer series keep their values, and days without a date are skipped.
+
+        Args:
+            newer (CovidSeries): The recent days, most recent first, such as from a delta update.
+
+        Returns:
+            CovidSeries: A new series with every day from both series.
+        """
+        newer_days = [
+            (date, newer, index) for index, date in enumerate(newer.dates) if date is not None
+        ]
+        if not newer_days:
+            return self
+        oldest = min(date for date, _, _ in newer_days)
+        replaced = {date for date, _, _ in newer_days}
+        # Only the most recent days of this series are scanned, since older days are unchanged
+        cut = next(
+            (
+                index
+                for index, date in enumerate(self.dates)
+                if date is not None and date < oldest
+            ),
+            len(self),
+        )
+        kept = [
+            (date, self, index)
+            for index, date in enumerate(self.dates[:cut])
+            if date is not None and date not in replaced
+        ]
+        days = sorted(newer_days + kept, key=lambda day: day[0], reverse=True)
+        return CovidSeries(
+            [date for date, _, _ in days] + self.dates[cut:],
+            {
+                metric: array("q", (series.values[metric][index] for _, series, index in days))
+                + self.values[metric][cut:]
+                for metric in METRICS
+            },
+            {
+                metric: bytearray(series.masks[metric][index] for _, series, index in days)
+                + self.masks[metric][cut:]
+                for metric in METRICS
+            },
+        )
+
+    def to_records(self) -> list:
+        """Convert the series back into rows of data, with missing values as None.
+
+        Returns:
+            list[dict]: Rows of data, most recent first.
+        """
+        columns = [
+            [
+                value if valid else None
+                for value, valid in zip(self.values[metric], self.masks[metric])
+            ]
+            for metric in METRICS
+        ]
+        return [
+            dict(zip(("date",) + METRICS, row)) for row in zip(self.dates, *columns)
+        ]
+
+    def prefix_sums(self, metric: str) -> array:
+        """Get the running totals of a metric, calculated once and then reused.
+
+        Args:
+            metric (str): The metric to total.
+
+        Returns:
+            array: Where element i is the total of the first i days, so it has one more element
+                than the series.
+        """
+        prefix = self._prefix_sums.get(metric)
+        if prefix is None:
+            prefix = array("q", accumulate(self.values[metric], initial=0))
+            self._prefix_sums[metric] = prefix
+        return prefix
+
+    def valid_prefix_sums(self, metric: str) -> array:
+        """Get the running count of valid values of a metric, calculated once and then reused.
+
+        Args:
+            metric (str): The metric to count.
+
+        Returns:
+            array: Where element i is the number of valid values in the first i days.
+        """
+        prefix = self._valid_prefix_sums.get(metric)
+        if prefix is None:
+            prefix = array("q", accumulate(self.masks[metric], initial=0))
+            self._valid_prefix_sums[metric] = prefix
+        return prefix
+
+    def window_sum(self, metric: str, start: int, window: int) -> int:
+        """Sum a metric over a window of days in constant time. Missing values count as 0.
+
+        Args:
+            metric (str): The metric to sum.
+            start (int): Index of the first (most recent) day in the window.
+            window (int): Number of days in the window.
+
+        Returns:
+            int: The total of the metric over the window.
+        """
+        prefix = self.prefix_sums(metric)
+        start = min(max(start, 0), len(self))
+        stop = min(start + window, len(self))
+        return prefix[stop] - prefix[start]
+
+    def rolling_sums(self, metric: str, window: int) -> array:
+        """Sum a metric over every window of consecutive days at once.
+
+        Args:
+            metric (str): The metric to sum.
+            window (int): Number of days in each window.
+
+        Returns:
+            array: Where element i is the total of days i to i + window - 1.
+        """
+        prefix = self.prefix_sums(metric)
+        if window > len(self):
+            return array("q")
+        return array("q", map(sub, prefix[window:], prefix[:-window]))
+
+    def valid_count(self, metric: str, start: int = 0, stop: Optional[int] = None) -> int:
+        """Count how many days between start and stop have a value for a metric.
+
+        Args:
+            metric (str): The metric to check.
+            start (int, optional): Index of the first day. Defaults to 0.
+            stop (Optional[int], optional): Index after the last day. Defaults to the end.
+
+        Returns:
+            int: The number of valid values.
+        """
+        stop = len(self) if stop is None else stop
+        return self.masks[metric].count(1, start, stop)
+
+    def rolling_means(self, metric: str, window: int) -> array:
+        """Average a metric over every window of consecutive days at once, ignoring missing values.
+
+        Args:
+            metric (str): The metric to average.
+            window (int): Number of days in each window.
+
+        Returns:
+            array: Where element i is the mean of the valid values in days i to i + window - 1, or
+                NAN if there are none.
+        """
+        if window > len(self):
+            return array("d")
+        valid = self.valid_prefix_sums(metric)
+        counts = map(sub, valid[window:], valid[:-window])
+        return array("d", map(_divide, self.rolling_sums(metric, window), counts))
+
+    def rolling_changes(self, metric: str, window: int = 7, lag: int = 7) -> array:
+        """Calculate the relative change of every window sum of a metric compared to the window
+        lag days earlier. With the defaults, this is the week on week change.
+
+        Args:
+            metric (str): The metric to compare.
+            window (int, optional): Number of days in each window. Defaults to 7.
+            lag (int, optional): Number of days between compared windows. Defaults to 7.
+
+        Returns:
+            array: Where element i is the fractional change from the window starting at day
+                i + lag to the window starting at day i, or NAN if the earlier window is 0.
+        """
+        sums = self.rolling_sums(metric, window)
+        if lag >= len(sums):
+            return array("d")
+        changes = map(sub, sums[:-lag], sums[lag:])
+        return array("d", map(_divide, changes, sums[lag:]))
+
+    def rolling_rates(
+        self, metric: str, window: int, population: Optional[int]
+    ) -> Optional[array]:
+        """Calculate every window sum of a metric as a rate per 100,000 people.
+
+        Args:
+            metric (str): The metric to sum.
+            window (int): Number of days in each window.
+            population (Optional[int]): The population of the area.
+
+        Returns:
+            Optional[array]: Where element i is the total of days i to i + window - 1 per 100,000
+                people, or None if the population is unknown or 0.
+        """
+        if not population:
+            return None
+        scale = 100_000 / population
+        return array("d", map(mul, self.rolling_sums(metric, window), repeat(scale)))
+
+    def week_on_week_change(self, metric: str, skip_first: bool = True) -> float:
+        """Get the most recent week on week change of a metric, starting from the same day as
+        sum_7days.
+
+        Args:
+            metric (str): The metric to compare.
+            skip_first (bool, optional): If first valid value should be skipped. Defaults to True.
+
+        Returns:
+            float: The fractional change from the previous 7 days, or NAN if it is unknown.
+        """
+        start = self.first_valid_index(metric)
+        if start == -1:
+            return NAN
+        start += 1 if skip_first else 0
+        current = self.window_sum(metric, start, 7)
+        previous = self.window_sum(metric, start + 7, 7)
+        return _divide(current - previous, previous)
+
+    def first_valid_index(self, metric: str) -> int:
+        """Get the index of the most recent day with a value for a metric.
+
+        Args:
+            metric (str): The metric to check.
+
+        Returns:
+            int: The index of the day, or -1 if the metric has no values.
+        """
+        return self.masks[metric].find(1)
+
+    def latest_valid(self, metric: str) -> Optional[int]:
+        """Get the most recent value of a metric.
+
+        Args:
+            metric (str): The metric to check.
+
+        Returns:
+            Optional[int]: The most recent value, or None if the metric has no values.
+        """
+        index = self.first_valid_index(metric)
+        return None if index == -1 else self.values[metric][index]
+
+    def sum_7days(self, metric: str, skip_first: bool = True) -> int:
+        """Sum the first 7 days of a metric, starting from the most recent valid value, in constant
+        time. Unlike covid_data_handler.sum_7days, which raises on a missing value after the first
+        valid one, missing values in the 7 days count as 0, so a gap in upstream data does not
+        stop the dashboard updating.
+
+        Args:
+            metric (str): The metric to sum.
+            skip_first (bool, optional): If first valid value should be skipped, since the most
+                recent day is usually incomplete. Defaults to True.
+
+        Returns:
+            int: Summed total of the metric over 7 days.
+        """
+        start = self.first_valid_index(metric)
+        if start == -1:
+            return 0
+        return self.window_sum(metric, start + 1 if skip_first else start, 7)
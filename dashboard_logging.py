@@ -0,0 +1,345 @@
+""" Configures the dashboards logging, so that writing log records to disk happens on a background
+thread in batches instead of on the threads handling requests.
+
+Log records are put on a bounded queue by the calling thread, then formatted and written by a
+listener thread to a log file that is rotated when it gets too large or too old.
+
+Attributes:
+    LOG_FILENAME (str): The default log file.
+    LOG_FORMAT (str): The format of each line of the log file.
+    LOG_MAX_BYTES (int): The size, in bytes, at which the log file is rotated.
+    LOG_BACKUP_COUNT (int): How many rotated log files are kept.
+    LOG_ROTATE_INTERVAL (float): How many seconds a log file is written to before it is rotated.
+    LOG_QUEUE_SIZE (int): The most records waiting to be written. Records are dropped, rather
+        than blocking the caller, when the queue is full.
+    LOG_PRESET_VARIABLE (str): The environment variable that selects the logging preset.
+    PRESETS (dict): The logging level, batch size and flush interval of each preset.
+        "development" logs everything, "production" only logs warnings and errors so the info
+        messages logged for every request are discarded before a record is created.
+    log_pipeline (Optional[LogPipeline]): The pipeline of the root logger, once configured.
+"""
+import atexit
+import copy
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from datetime import timedelta
+from time import perf_counter
+from typing import List, Optional, Tuple
+
+LOG_FILENAME = "covid_dashboard.log"
+LOG_FORMAT = (
+    "%(asctime)s (%(thread)d) [%(levelname)s]: %(message)s (%(funcName)s in %(module)s)"
+)
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+LOG_ROTATE_INTERVAL = timedelta(days=1).total_seconds()
+LOG_QUEUE_SIZE = 10_000
+LOG_PRESET_VARIABLE = "COVID_DASHBOARD_LOG_PRESET"
+PRESETS = {
+    "development": {"level": logging.DEBUG, "batch_size": 64, "flush_interval": 1.0},
+    "production": {"level": logging.WARNING, "batch_size": 256, "flush_interval": 5.0},
+}
+log_pipeline: Optional["LogPipeline"] = None
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Puts log records on a queue without ever blocking, and times how long it takes so the
+    cost of logging to the calling thread can be measured.
+
+    Only the message is merged with its arguments on the calling thread. The full record is
+    formatted on the listener thread. The counters are updated by every logging thread, so they
+    are guarded by a lock.
+
+    Attributes:
+        records (int): The number of records queued.
+        dropped (int): The number of records dropped because the queue was full.
+        enqueue_time (float): The total seconds spent queueing records.
+    """
+
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+        self.records = 0
+        self.dropped = 0
+        self.enqueue_time = 0.0
+        self._counters_lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Merge the message and its arguments, and render any traceback, so the record can be
+        formatted later without referring to objects that may have changed.
+
+        Args:
+            record (LogRecord): The record to prepare.
+
+        Returns:
+            LogRecord: A copy of the record.
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """Put a record on the queue, dropping it if the queue is full.
+
+        Args:
+            record (LogRecord): The prepared record.
+        """
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._counters_lock:
+                self.dropped += 1
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Queue a record, timing how long it takes.
+
+        Args:
+            record (LogRecord): The record to queue.
+        """
+        started = perf_counter()
+        super().emit(record)
+        elapsed = perf_counter() - started
+        with self._counters_lock:
+            self.records += 1
+            self.enqueue_time += elapsed
+
+    def counters(self) -> Tuple[int, int, float]:
+        """Get a consistent snapshot of the counters.
+
+        Returns:
+            tuple: The records queued, the records dropped and the seconds spent queueing.
+        """
+        with self._counters_lock:
+            return self.records, self.dropped, self.enqueue_time
+
+
+class BufferedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Writes formatted records to a file in batches, rotating the file when it reaches a maximum
+    size or has been written to for the rotate interval.
+
+    A batch is written when batch_size records are buffered, when a record at or above
+    flush_level is handled, or when flush is called, which the listener does when idle.
+
+    Attributes:
+        batch_size (int): How many records are buffered before they are written.
+        flush_level (int): Records at or above this level are written straight away.
+        rotate_interval (float): How many seconds a log file is written to before it is rotated.
+        rollover_at (float): When the log file will next be rotated, as from time.time().
+        batches (int): The number of batches written.
+        write_time (float): The total seconds spent writing batches.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        max_bytes: int = LOG_MAX_BYTES,
+        backup_count: int = LOG_BACKUP_COUNT,
+        rotate_interval: float = LOG_ROTATE_INTERVAL,
+        batch_size: int = 64,
+        flush_level: int = logging.ERROR,
+    ) -> None:
+        super().__init__(
+            filename,
+            maxBytes=max_bytes,
+            backupCount=backup_count,
+            encoding="utf-8",
+            delay=True,
+        )
+        self.batch_size = batch_size
+        self.flush_level = flush_level
+        self.rotate_interval = rotate_interval
+        self.rollover_at = time.time() + rotate_interval
+        self.batches = 0
+        self.write_time = 0.0
+        self._buffer: List[str] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Format a record and add it to the buffer, writing the buffer if it is full.
+
+        Args:
+            record (LogRecord): The record to write.
+        """
+        try:
+            self._buffer.append(self.format(record))
+        except Exception:  # pylint: disable=broad-except
+            self.handleError(record)
+            return
+        if len(self._buffer) >= self.batch_size or record.levelno >= self.flush_level:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write every buffered record to the log file, rotating it first if necessary."""
+        self.acquire()
+        try:
+            if not self._buffer:
+                return
+            started = perf_counter()
+            text = self.terminator.join(self._buffer) + self.terminator
+            self._buffer.clear()
+            if self.stream is None:
+                self.stream = self._open()
+            if self._should_rotate(len(text)):
+                self.doRollover()
+                self.stream = self._open()
+            self.stream.write(text)
+            self.stream.flush()
+            self.batches += 1
+            self.write_time += perf_counter() - started
+        finally:
+            self.release()
+
+    def _should_rotate(self, size: int) -> bool:
+        written = self.stream.tell()
+        if written == 0:
+            return False
+        if time.time() >= self.rollover_at:
+            self.rollover_at = time.time() + self.rotate_interval
+            return True
+        return 0 < self.maxBytes < written + size
+
+    def close(self) -> None:
+        """Write any buffered records, then close the log file."""
+        self.flush()
+        super().close()
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    """A queue listener that flushes its handlers whenever the queue has been empty for the flush
+    interval, so buffered records are never held for long.
+
+    Attributes:
+        flush_interval (float): How many idle seconds before the handlers are flushed.
+    """
+
+    def __init__(self, log_queue: queue.Queue, *handlers, flush_interval: float = 1.0) -> None:
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.flush_interval = flush_interval
+
+    def dequeue(self, block: bool) -> logging.LogRecord:
+        """Get the next record from the queue, flushing the handlers while waiting for it.
+
+        Args:
+            block (bool): If the call should wait for a record.
+
+        Returns:
+            LogRecord: The next record.
+        """
+        while True:
+            try:
+                return self.queue.get(block, timeout=self.flush_interval)
+            except queue.Empty:
+                if not block:
+                    raise
+                for handler in self.handlers:
+                    handler.flush()
+
+
+class LogPipeline:
+    """A queue handler, and the listener thread that writes its records to a rotated log file.
+
+    Attributes:
+        preset (str): The name of the preset the pipeline was created with.
+        level (int): The logging level of the preset.
+        queue_handler (NonBlockingQueueHandler): The handler attached to the logger.
+        file_handler (BufferedRotatingFileHandler): The handler that writes the log file.
+        listener (BatchingQueueListener): The thread that passes records to the file handler.
+    """
+
+    def __init__(self, filename: str = LOG_FILENAME, preset: str = "development") -> None:
+        if preset not in PRESETS:
+            raise ValueError(f"Unknown logging preset {preset}, expected one of {list(PRESETS)}")
+        settings = PRESETS[preset]
+        self.preset = preset
+        self.level = settings["level"]
+        log_queue: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+        self.queue_handler = NonBlockingQueueHandler(log_queue)
+        self.file_handler = BufferedRotatingFileHandler(
+            filename, batch_size=settings["batch_size"]
+        )
+        self.file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        self.listener = BatchingQueueListener(
+            log_queue, self.file_handler, flush_interval=settings["flush_interval"]
+        )
+        self._running = False
+
+    def attach(self, logger: logging.Logger) -> "LogPipeline":
+        """Attach the queue handler to a logger and start the listener thread.
+
+        Args:
+            logger (Logger): The logger to attach to.
+
+        Returns:
+            LogPipeline: The pipeline.
+        """
+        logger.setLevel(self.level)
+        logger.addHandler(self.queue_handler)
+        self.listener.start()
+        self._running = True
+        return self
+
+    def detach(self, logger: logging.Logger) -> None:
+        """Remove the queue handler from a logger, then write every queued record and stop the
+        listener thread.
+
+        Args:
+            logger (Logger): The logger to detach from.
+        """
+        logger.removeHandler(self.queue_handler)
+        if self._running:
+            self.listener.stop()
+            self._running = False
+        self.file_handler.close()
+
+    def stats(self) -> dict:
+        """Get the cost of logging to callers and to the listener thread.
+
+        Returns:
+            dict: The records queued and dropped, the mean seconds spent queueing a record on
+                the calling thread, and the batches written and seconds spent writing them.
+        """
+        records, dropped, enqueue_time = self.queue_handler.counters()
+        return {
+            "preset": self.preset,
+            "records": records,
+            "dropped": dropped,
+            "queued": self.queue_handler.queue.qsize(),
+            "mean_enqueue_time": enqueue_time / records if records else None,
+            "batches": self.file_handler.batches,
+            "write_time": self.file_handler.write_time,
+        }
+
+
+def configure_logging(
+    preset: Optional[str] = None, filename: str = LOG_FILENAME
+) -> LogPipeline:
+    """Send the root loggers records through a log pipeline, replacing any pipeline already
+    configured. The pipeline is stopped, writing every queued record, when the program exits.
+
+    Args:
+        preset (Optional[str], optional): The logging preset. Defaults to the value of the
+            COVID_DASHBOARD_LOG_PRESET environment variable, or "development".
+        filename (str, optional): The log file. Defaults to LOG_FILENAME.
+
+    Returns:
+        LogPipeline: The root loggers pipeline.
+    """
+    global log_pipeline
+    preset = preset or os.environ.get(LOG_PRESET_VARIABLE, "development")
+    root = logging.getLogger()
+    if log_pipeline is not None:
+        atexit.unregister(log_pipeline.detach)
+        log_pipeline.detach(root)
+    log_pipeline = LogPipeline(filename, preset).attach(root)
+    atexit.register(log_pipeline.detach, root)
+    if preset == "production":
+        # The dashboard runs in one process, so the process details of records are not needed
+        logging.logProcesses = False
+        logging.logMultiprocessing = False
+    return log_pipeline
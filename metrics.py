@@ -0,0 +1,331 @@
+""" Lightweight, thread safe metrics for timing the dashboards hot paths, exposed in the Prometheus
+text format.
+
+Metrics are counters and histograms updated as the dashboard runs. Values that are already
+counted elsewhere, such as cache hit counts, are read by collectors when the metrics are rendered.
+
+Attributes:
+    DEFAULT_BUCKETS (tuple): The default upper bounds, in seconds, of histogram buckets.
+    CONTENT_TYPE (str): The content type of rendered metrics.
+    registry (Registry): The dashboards metrics.
+    FUNCTION_DURATION (Histogram): How long instrumented functions take, labelled by function.
+    UPSTREAM_LATENCY (Histogram): How long upstream API requests take, labelled by upstream.
+    UPSTREAM_ERRORS (Counter): How many upstream API requests failed, labelled by upstream.
+"""
+import math
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# A metric family is its name, type, help text and samples, where each sample is its name,
+# labels and value
+Sample = Tuple[str, Dict[str, str], float]
+Family = Tuple[str, str, str, List[Sample]]
+
+
+class Registry:
+    """The metrics and collectors rendered together."""
+
+    def __init__(self) -> None:
+        self._metrics: dict = {}
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric) -> None:
+        """Add a metric to the registry.
+
+        Args:
+            metric (Counter | Histogram): The metric.
+
+        Raises:
+            ValueError: If a metric with the same name is already registered.
+        """
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def add_collector(self, collector: Callable[[], Iterable[Family]]) -> None:
+        """Add a function that is called when the metrics are rendered, and returns metric
+        families for values that are counted elsewhere.
+
+        Args:
+            collector (Callable): Returns (name, type, help, samples) for each family.
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def collect(self) -> Iterator[Family]:
+        """Get every metric family.
+
+        Returns:
+            Iterator[tuple]: The name, type, help and samples of each family.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        for metric in metrics:
+            yield metric.name, metric.kind, metric.documentation, metric.samples()
+        for collector in collectors:
+            yield from collector()
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text format.
+
+        Returns:
+            str: The rendered metrics.
+        """
+        lines = []
+        for name, kind, documentation, samples in self.collect():
+            lines.append(f"# HELP {name} {_escape(documentation, help_text=True)}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class Counter:
+    """A value that only increases, such as a number of requests, with one value per set of
+    labels.
+
+    Attributes:
+        name (str): The name of the metric.
+        documentation (str): The help text of the metric.
+        labelnames (tuple): The names of the metrics labels.
+    """
+
+    kind = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        metrics_registry: Optional[Registry] = None,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        (metrics_registry or registry).register(self)
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """Increase the counter.
+
+        Args:
+            amount (float, optional): How much to increase it by. Defaults to 1.
+            **labels (str): The value of each of the metrics labels.
+        """
+        key = _label_values(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        """Get the value of the counter.
+
+        Args:
+            **labels (str): The value of each of the metrics labels.
+
+        Returns:
+            float: The value.
+        """
+        with self._lock:
+            return self._values.get(_label_values(self.labelnames, labels), 0)
+
+    def samples(self) -> List[Sample]:
+        """Get the value for each set of labels.
+
+        Returns:
+            list[tuple]: The name, labels and value of each sample.
+        """
+        with self._lock:
+            values = list(self._values.items())
+        return [
+            (f"{self.name}_total", dict(zip(self.labelnames, key)), value)
+            for key, value in values
+        ]
+
+
+class Histogram:
+    """Counts observed values, such as durations, into buckets, with one set of buckets per set
+    of labels.
+
+    Attributes:
+        name (str): The name of the metric.
+        documentation (str): The help text of the metric.
+        labelnames (tuple): The names of the metrics labels.
+        buckets (tuple): The upper bound of each bucket.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        metrics_registry: Optional[Registry] = None,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # For each set of labels, the count in each bucket then the overflow, the sum and count
+        self._values: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+        (metrics_registry or registry).register(self)
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Count a value into its bucket.
+
+        Args:
+            value (float): The value, such as a duration in seconds.
+            **labels (str): The value of each of the metrics labels.
+        """
+        key = _label_values(self.labelnames, labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            values[index] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe how long the body of a with statement takes.
+
+        Args:
+            **labels (str): The value of each of the metrics labels.
+        """
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - started, **labels)
+
+    def count(self, **labels: str) -> int:
+        """Get how many values have been observed.
+
+        Args:
+            **labels (str): The value of each of the metrics labels.
+
+        Returns:
+            int: The number of observed values.
+        """
+        with self._lock:
+            values = self._values.get(_label_values(self.labelnames, labels))
+            return 0 if values is None else values[-1]
+
+    def samples(self) -> List[Sample]:
+        """Get the cumulative bucket counts, sum and count for each set of labels.
+
+        Returns:
+            list[tuple]: The name, labels and value of each sample.
+        """
+        with self._lock:
+            values = [(key, list(counts)) for key, counts in self._values.items()]
+        samples = []
+        for key, counts in values:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append(
+                    (f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative)
+                )
+            samples.append((f"{self.name}_sum", labels, counts[-2]))
+            samples.append((f"{self.name}_count", labels, counts[-1]))
+        return samples
+
+
+def timed(histogram: Histogram, **labels: str) -> Callable:
+    """Decorate a function so every call is observed by a histogram, even if it raises.
+
+    Args:
+        histogram (Histogram): The histogram of durations.
+        **labels (str): The value of each of the histograms labels.
+
+    Returns:
+        Callable: The decorator.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(perf_counter() - started, **labels)
+
+        return wrapper
+
+    return decorator
+
+
+def instrument(func: Callable) -> Callable:
+    """Decorate a function so its duration is observed by FUNCTION_DURATION.
+
+    Args:
+        func (Callable): The function.
+
+    Returns:
+        Callable: The instrumented function.
+    """
+    return timed(FUNCTION_DURATION, function=func.__name__)(func)
+
+
+def _label_values(labelnames: tuple, labels: dict) -> tuple:
+    if len(labels) != len(labelnames) or not all(name in labels for name in labelnames):
+        raise ValueError(f"Expected labels {labelnames}, got {tuple(labels)}")
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+def _escape(value: str, help_text: bool = False) -> str:
+    value = value.replace("\\", "\\\\").replace("\n", "\\n")
+    return value if help_text else value.replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items())
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value is None or math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+registry = Registry()
+FUNCTION_DURATION = Histogram(
+    "dashboard_function_duration_seconds",
+    "How long instrumented dashboard functions take.",
+    ("function",),
+)
+UPSTREAM_LATENCY = Histogram(
+    "dashboard_upstream_request_duration_seconds",
+    "How long requests to the upstream COVID and news APIs take.",
+    ("upstream",),
+)
+UPSTREAM_ERRORS = Counter(
+    "dashboard_upstream_errors",
+    "How many requests to the upstream COVID and news APIs failed.",
+    ("upstream",),
+)
@@ -1,22 +1,467 @@
 """ Handles scheduling of data and news updates requested from the front end.
 
 Attributes:
+    REPEAT_INTERVAL (float): How many seconds after an occurrence a repeating event runs again.
+    JOB_WORKERS (int): The maximum number of scheduled jobs that run at once.
+    JOB_TIMEOUT (float): How many seconds after it was submitted a job times out, and a new job
+        with the same key can be started.
+    JOB_QUEUE_SIZE (int): The most scheduled jobs queued or running at once. Submitting another
+        job waits until one finishes.
     log (Logger): The logger for the covid_dashboard.
-    scheduler (scheduler): The sched scheduler object.
-    scheduled_events (list): A list of dictionaries of scheduled events.
+    scheduled_events (EventRegistry): The scheduled events, indexed by title and time.
+    scheduler (SchedulerRunner): The thread that runs scheduled events when they are due.
+    job_pool (JobPool): The worker pool the COVID data and news updates of events run on.
+    SCHEDULER_LAG (Histogram): How many seconds after they were due scheduled events ran.
+    JOB_QUEUE_DELAY (Histogram): How long jobs waited for a worker, labelled by kind.
+    JOB_DURATION (Histogram): How long jobs ran for, labelled by kind.
 """
 
-import sched
+import heapq
+import itertools
+import threading
 import time
 import logging
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import timedelta, datetime
-from utils import time_until, get_settings
-from covid_data_handler import get_covid_data
-from covid_news_handling import update_news
+from typing import Callable, Dict, Hashable, Iterator, Optional, Tuple
+from utils import time_until, get_settings, bump_dashboard_version
+from covid_data_handler import cached_covid_areas, refresh_covid_area
+from covid_news_handling import COVID_TERMS, get_news
+from metrics import Histogram, instrument
 
-scheduler = sched.scheduler(time.time, time.sleep)
-scheduled_events: list = []
+REPEAT_INTERVAL = timedelta(hours=24).total_seconds()
+JOB_WORKERS = 4
+JOB_TIMEOUT = timedelta(minutes=5).total_seconds()
+JOB_QUEUE_SIZE = 16
 log = logging.getLogger("covid_dashboard")
+SCHEDULER_LAG = Histogram(
+    "dashboard_scheduler_lag_seconds",
+    "How many seconds after they were due scheduled events ran.",
+)
+JOB_QUEUE_DELAY = Histogram(
+    "dashboard_job_queue_delay_seconds",
+    "How long scheduled jobs waited for a worker.",
+    ("kind",),
+)
+JOB_DURATION = Histogram(
+    "dashboard_job_duration_seconds",
+    "How long scheduled jobs ran for.",
+    ("kind",),
+)
+
+
+class EventRegistry:
+    """Scheduled events indexed by title in a dict, and by the time they run in a heap, so adding,
+    removing and finding the next event take O(log n) time.
+
+    Removed events are left in the heap and skipped when they reach the top. The heap is rebuilt
+    once most of it is removed events.
+    """
+
+    def __init__(self) -> None:
+        self._events: dict = {}
+        self._heap: list = []
+        self._ids = itertools.count()
+        self._lock = threading.RLock()
+
+    def __contains__(self, title: str) -> bool:
+        return title in self._events
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def __iter__(self) -> Iterator[dict]:
+        """Iterate over a snapshot of the events, in the order they will run."""
+        with self._lock:
+            events = list(self._events.values())
+        return iter(sorted(events, key=lambda event: (event["run_at"], event["id"])))
+
+    def get(self, title: str) -> Optional[dict]:
+        """Get an event by its title.
+
+        Args:
+            title (str): The title of the event.
+
+        Returns:
+            Optional[dict]: The event, or None if there is no event with that title.
+        """
+        return self._events.get(title)
+
+    def add(self, event: dict) -> dict:
+        """Add an event, giving it a unique "id". Replaces any event with the same title.
+
+        Args:
+            event (dict): The event, which must have a "title" and the time it runs as "run_at".
+
+        Returns:
+            dict: The event.
+        """
+        with self._lock:
+            event["id"] = next(self._ids)
+            self._events[event["title"]] = event
+            heapq.heappush(self._heap, (event["run_at"], event["id"], event["title"]))
+        return event
+
+    def remove(self, title: str) -> Optional[dict]:
+        """Remove an event by its title.
+
+        Args:
+            title (str): The title of the event.
+
+        Returns:
+            Optional[dict]: The removed event, or None if there was no event with that title.
+        """
+        with self._lock:
+            event = self._events.pop(title, None)
+            if len(self._heap) > 2 * len(self._events) + 16:
+                self._heap = [entry for entry in self._heap if self._is_current(entry)]
+                heapq.heapify(self._heap)
+        return event
+
+    def next_event(self) -> Optional[dict]:
+        """Get the next event that will run.
+
+        Returns:
+            Optional[dict]: The next event, or None if there are no events.
+        """
+        with self._lock:
+            while self._heap and not self._is_current(self._heap[0]):
+                heapq.heappop(self._heap)
+            return self._events[self._heap[0][2]] if self._heap else None
+
+    def pop_due(self, now: float) -> Tuple[Optional[dict], Optional[float]]:
+        """Remove and return the next event if it is due.
+
+        Args:
+            now (float): The current time, as from time.time().
+
+        Returns:
+            tuple: The due event, or None, and the seconds until the next event is due, or None if
+                there are no events.
+        """
+        with self._lock:
+            event = self.next_event()
+            if event is None:
+                return None, None
+            if event["run_at"] > now:
+                return None, event["run_at"] - now
+            self.remove(event["title"])
+            return event, now - event["run_at"]
+
+    def is_current(self, title: str, event_id: int) -> bool:
+        """Check if an event is still scheduled, and has not been removed or replaced.
+
+        Args:
+            title (str): The title of the event.
+            event_id (int): The "id" of the event.
+
+        Returns:
+            bool: If the event is still scheduled.
+        """
+        event = self._events.get(title)
+        return event is not None and event["id"] == event_id
+
+    def _is_current(self, entry: tuple) -> bool:
+        return self.is_current(entry[2], entry[1])
+
+
+class SchedulerRunner(threading.Thread):
+    """A daemon thread that sleeps until the next scheduled event is due, then runs it. It is woken
+    straight away when events are added or cancelled, so it never polls.
+
+    Attributes:
+        events (EventRegistry): The events to run.
+        wakeups (int): How many times the thread has woken up.
+        events_run (int): How many events have been run.
+        last_lag (Optional[float]): How many seconds after it was due the last event ran.
+        max_lag (float): The most seconds after it was due any event ran.
+        total_lag (float): The total seconds after they were due every event ran.
+    """
+
+    def __init__(self, events: EventRegistry) -> None:
+        super().__init__(name="scheduler", daemon=True)
+        self.events = events
+        self.wakeups = 0
+        self.events_run = 0
+        self.last_lag: Optional[float] = None
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+        self._condition = threading.Condition()
+        self._stopped = False
+
+    def wake(self) -> None:
+        """Wake the thread so it checks for a new next event."""
+        with self._condition:
+            self._condition.notify()
+
+    def stop(self) -> None:
+        """Stop the thread after any running event has finished."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def run(self) -> None:
+        """Run events as they become due, until stopped."""
+        log.info("Scheduler thread started")
+        while True:
+            with self._condition:
+                if self._stopped:
+                    break
+                event, delay = self.events.pop_due(time.time())
+                if event is None:
+                    # Sleep until the next event is due, or until woken by a change
+                    self._condition.wait(delay)
+                    self.wakeups += 1
+                    continue
+            self.record_lag(delay)
+            bump_dashboard_version()
+            try:
+                call_event(
+                    event["title"],
+                    event["target_time"],
+                    event["repeat"],
+                    event["data"],
+                    event["news"],
+                    run_at=event["run_at"],
+                )
+            except Exception:  # pylint: disable=broad-except
+                log.exception("Scheduled event %s failed", event["title"])
+        log.info("Scheduler thread stopped")
+
+    def record_lag(self, lag: float) -> None:
+        """Record how late an event ran.
+
+        Args:
+            lag (float): How many seconds after it was due the event ran.
+        """
+        self.events_run += 1
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        self.total_lag += lag
+        SCHEDULER_LAG.observe(lag)
+
+    def stats(self) -> dict:
+        """Get the number of wakeups, the number of events run and their lag.
+
+        Returns:
+            dict: The wakeups, events_run, last_lag, max_lag and mean_lag.
+        """
+        return {
+            "wakeups": self.wakeups,
+            "events_run": self.events_run,
+            "last_lag": self.last_lag,
+            "max_lag": self.max_lag,
+            "mean_lag": self.total_lag / self.events_run if self.events_run else None,
+        }
+
+
+class JobPool:
+    """A bounded worker pool for the jobs of scheduled events, so a slow upstream request does not
+    delay other events.
+
+    Jobs are submitted with a key for what they update, such as the nation whose areas a COVID
+    job refreshes. While a job is queued or running, submitting another job with the same key
+    returns the first jobs future instead. At most queue_size jobs are queued or running, and
+    submitting another waits until one finishes, so a burst of events slows the scheduler down
+    rather than queueing without bound.
+
+    A watchdog fails the future of a job that has not finished within the timeout with a
+    TimeoutError, and frees its key and its place in the queue. A running job cannot be stopped,
+    so it is left to finish in the background, and a queued job is skipped when it starts.
+
+    Attributes:
+        timeout (float): How many seconds after it was submitted a job times out.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = JOB_WORKERS,
+        timeout: float = JOB_TIMEOUT,
+        queue_size: int = JOB_QUEUE_SIZE,
+    ) -> None:
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="scheduled_job"
+        )
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._in_flight: Dict[tuple, Future] = {}
+        self._stats: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, key: Hashable, func: Callable, *args, **kwargs) -> Future:
+        """Run a job on the pool, unless a job with the same kind and key is already in flight.
+        Waits for a place in the queue if it is full.
+
+        Args:
+            kind (str): The kind of job, such as "covid" or "news", which its metrics are kept
+                under.
+            key (Hashable): What the job updates. Jobs of the same kind and key are coalesced.
+            func (Callable): The function to call.
+            *args: Positional arguments for func.
+            **kwargs: Keyword arguments for func.
+
+        Returns:
+            Future: The future of the job, or of the job already in flight. It fails with a
+                TimeoutError if the job does not finish within the timeout.
+        """
+        future = self._coalesce(kind, key)
+        if future is not None:
+            return future
+        self._slots.acquire()  # pylint: disable=consider-using-with
+        with self._lock:
+            # Another job with the same key may have been submitted while waiting
+            future = self._in_flight.get((kind, key))
+            if future is None:
+                future = self._in_flight[(kind, key)] = Future()
+                self._stats[kind]["submitted"] += 1
+                submitted = True
+            else:
+                self._stats[kind]["coalesced"] += 1
+                submitted = False
+        if not submitted:
+            self._slots.release()
+            return future
+        watchdog = threading.Timer(self.timeout, self._expire, (kind, key, future))
+        watchdog.daemon = True
+        watchdog.start()
+        self._executor.submit(
+            self._run, kind, key, future, watchdog, time.monotonic(), func, *args, **kwargs
+        )
+        return future
+
+    def _coalesce(self, kind: str, key: Hashable) -> Optional[Future]:
+        with self._lock:
+            stats = self._stats.setdefault(kind, _new_job_stats())
+            future = self._in_flight.get((kind, key))
+            if future is not None:
+                stats["coalesced"] += 1
+                log.info("Coalesced %s job for %s with the job in flight", kind, key)
+            return future
+
+    def _run(
+        self,
+        kind: str,
+        key: Hashable,
+        future: Future,
+        watchdog: threading.Timer,
+        submitted: float,
+        func: Callable,
+        *args,
+        **kwargs,
+    ) -> None:
+        if future.done():
+            log.warning("Skipping %s job for %s, which timed out while queued", kind, key)
+            return
+        started = time.monotonic()
+        result = None
+        try:
+            result = func(*args, **kwargs)
+        except Exception:  # pylint: disable=broad-except
+            log.exception("%s job for %s failed", kind, key)
+            with self._lock:
+                self._stats[kind]["failures"] += 1
+        finally:
+            watchdog.cancel()
+            self._record(kind, started - submitted, time.monotonic() - started)
+        self._settle(kind, key, future, result=result)
+
+    def _expire(self, kind: str, key: Hashable, future: Future) -> None:
+        error = TimeoutError(f"{kind} job for {key} timed out after {self.timeout}s")
+        if self._settle(kind, key, future, error=error):
+            log.warning("%s, leaving it to finish in the background", error)
+            with self._lock:
+                self._stats[kind]["timeouts"] += 1
+
+    def _settle(
+        self,
+        kind: str,
+        key: Hashable,
+        future: Future,
+        result=None,
+        error: Optional[BaseException] = None,
+    ) -> bool:
+        # Whichever of the job and its watchdog finishes first settles the future
+        with self._lock:
+            if future.done():
+                return False
+            if self._in_flight.get((kind, key)) is future:
+                del self._in_flight[(kind, key)]
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        self._slots.release()
+        return True
+
+    def _record(self, kind: str, queue_delay: float, execution_time: float) -> None:
+        JOB_QUEUE_DELAY.observe(queue_delay, kind=kind)
+        JOB_DURATION.observe(execution_time, kind=kind)
+        with self._lock:
+            stats = self._stats[kind]
+            stats["completed"] += 1
+            stats["queue_delay_total"] += queue_delay
+            stats["queue_delay_max"] = max(stats["queue_delay_max"], queue_delay)
+            stats["execution_time_total"] += execution_time
+            stats["execution_time_max"] = max(stats["execution_time_max"], execution_time)
+
+    def in_flight(self) -> list:
+        """Get the jobs that are queued or running.
+
+        Returns:
+            list[tuple]: The kind and key of each job.
+        """
+        with self._lock:
+            return list(self._in_flight)
+
+    def stats(self) -> dict:
+        """Get the metrics of each kind of job.
+
+        Returns:
+            dict: For each kind, the number of jobs submitted, coalesced, completed, failed and
+                timed out, with the mean and max queue delay and execution time in seconds.
+        """
+        with self._lock:
+            report = {}
+            for kind, stats in self._stats.items():
+                completed = stats["completed"]
+                report[kind] = {
+                    "submitted": stats["submitted"],
+                    "coalesced": stats["coalesced"],
+                    "completed": completed,
+                    "failures": stats["failures"],
+                    "timeouts": stats["timeouts"],
+                    "queue_delay_mean": (
+                        stats["queue_delay_total"] / completed if completed else None
+                    ),
+                    "queue_delay_max": stats["queue_delay_max"],
+                    "execution_time_mean": (
+                        stats["execution_time_total"] / completed if completed else None
+                    ),
+                    "execution_time_max": stats["execution_time_max"],
+                }
+            return report
+
+
+def _new_job_stats() -> dict:
+    return dict.fromkeys(
+        (
+            "submitted",
+            "coalesced",
+            "completed",
+            "failures",
+            "timeouts",
+            "queue_delay_total",
+            "queue_delay_max",
+            "execution_time_total",
+            "execution_time_max",
+        ),
+        0,
+    )
+
+
+scheduled_events = EventRegistry()
+scheduler = SchedulerRunner(scheduled_events)
+job_pool = JobPool()
 
 
 def schedule_event(
@@ -26,6 +471,7 @@ def schedule_event(
     data: bool,
     news: bool,
     new: bool = True,
+    run_at: Optional[float] = None,
 ) -> None:
     """Schedule a new event to occur at a given time.
 
@@ -36,50 +482,45 @@ def schedule_event(
         data (bool): If the scheduled event should update the dashboards COVID data.
         news (bool): If the scheduled event should update the dashboards news data.
         new (bool, optional): If the event is new (has just been added). Defaults to True.
+        run_at (Optional[float], optional): When the event runs, as from time.time(). Defaults
+            to None, which is the next time the clock strikes target_time.
     """
     log.info(  # pylint: disable=logging-fstring-interpolation
         f"Scheduling {'new' if new else 'repeating'} event {label} at"
         f" {target_time} with {repeat = } for {data = } and {news = }"
     )
-    label_exists = any(event["title"] == label for event in scheduled_events)
-    if not label_exists:
-        time_delta = time_until(target_time)
-        sched_event = scheduler.enter(
-            time_delta.seconds, 1, call_event, (label, target_time, repeat, data, news)
-        )
-
+    if label not in scheduled_events:
+        if run_at is None:
+            # time_until is never zero, so a new event never runs straight away
+            run_at = time.time() + time_until(target_time).total_seconds()
         new_event = {
             "title": label,
             "target_time": target_time,
             "repeat": repeat,
             "data": data,
             "news": news,
-            "sched_event": sched_event,
+            "run_at": run_at,
             "new": new,
         }
-
-        # Insert in time order
-        if not scheduled_events:
-            log.info("Appending %s to scheduled_events", label)
-            scheduled_events.append(new_event)
-        else:
-            for index, event in enumerate(scheduled_events):
-                if time_until(target_time) < time_until(event["target_time"]):
-                    scheduled_events.insert(index, new_event)
-                    break
-                if index == len(scheduled_events) - 1:
-                    log.info("Appending %s to scheduled_events", label)
-                    scheduled_events.append(new_event)
-                    break
+        scheduled_events.add(new_event)
+        scheduler.wake()
+        log.info("Added %s to scheduled_events", label)
+        bump_dashboard_version()
     else:
         log.warning("Scheduled update with label = %s already exists", label)
 
 
+@instrument
 def call_event(
-    label: str, target_time: timedelta, repeat: bool, data: bool, news: bool
+    label: str,
+    target_time: timedelta,
+    repeat: bool,
+    data: bool,
+    news: bool,
+    run_at: Optional[float] = None,
 ) -> None:
-    """Called when the time comes for a scheduled event to run. Utilises the necessary COVID and
-    news function and deals with repeated events.
+    """Called when the time comes for a scheduled event to run. Submits the necessary COVID and
+    news updates to the job pool and deals with repeated events.
 
     Args:
         label (str): Label of event to be run.
@@ -87,6 +528,8 @@ def call_event(
         repeat (bool): If the event should repeat in 24 hours or not.
         data (bool): If the event should update the COVID data.
         news (bool): If the event should update the news.
+        run_at (Optional[float], optional): When the event was due to run, as from time.time().
+            Defaults to None, which is now.
     """
     log.info(  # pylint: disable=logging-fstring-interpolation
         f"Running scheduled event {label} with {repeat = } for {data = } and {news = }"
@@ -98,16 +541,34 @@ def call_event(
     )
 
     remove_event(label)
+    # Repeat before updating, so a failed update does not stop the event repeating
+    if repeat:
+        # The next occurrence is a whole interval after this one, rather than the next time the
+        # clock strikes target_time, which is this occurrence again if it is still the same second
+        now = time.time()
+        next_run = (now if run_at is None else run_at) + REPEAT_INTERVAL
+        while next_run <= now:
+            next_run += REPEAT_INTERVAL
+        log.info("Repeating event for %s", target_time)
+        schedule_event(target_time, label, repeat, data, news, new=False, run_at=next_run)
     if data:
         location, nation = get_settings(  # pylint: disable=unbalanced-tuple-unpacking
             "location", "nation"
         )
-        get_covid_data(location, nation, force_update=True)
+        # Every location being viewed is updated, along with the configured location. Each job
+        # refreshes the locations sharing one national request, and is keyed on that nation
+        areas = cached_covid_areas([(location, nation, "ltla")])
+        for (area_nation, location_type), locations in areas.items():
+            job_pool.submit(
+                "covid",
+                (area_nation, location_type),
+                refresh_covid_area,
+                locations,
+                area_nation,
+                location_type,
+            )
     if news:
-        update_news()
-    if repeat:
-        log.info("Repeating event for %s", target_time)
-        schedule_event(target_time, label, repeat, data, news, new=False)
+        job_pool.submit("news", COVID_TERMS, get_news, COVID_TERMS, force_update=True)
 
 
 def remove_event(title: str) -> None:
@@ -117,23 +578,34 @@ def remove_event(title: str) -> None:
         title (str): The title of the event to be removed
     """
     log.info("Removing event %s", title)
-    global scheduled_events
-    scheduled_events[:] = [
-        event for event in scheduled_events if event["title"] != title
-    ]
-
-
-def keep_alive() -> None:
-    """This function does nothing but print a smiley face to the console every 10 seconds. If you
-    are thinking that this is completely pointless, you are correct. However without this function,
-    the whole scheduling system breaks in the most spectacular ways. Indeed, even removing the
-    print statement alone stops the scheduler from working at all. Its highly likely that it does
-    not need to be a smiley face that is printed to the console in order for this to work, but at
-    this point I am simply to scared to even begin to modify this function.
+    if scheduled_events.remove(title) is not None:
+        bump_dashboard_version()
+
+
+def cancel_event(title: str) -> bool:
+    """Cancels a scheduled event so it will not run.
+
+    Args:
+        title (str): The title of the event to be cancelled
+
+    Returns:
+        bool: If there was an event with the title to cancel.
+    """
+    log.info("Cancelling event %s", title)
+    if title not in scheduled_events:
+        return False
+    remove_event(title)
+    scheduler.wake()
+    return True
+
+
+def start_scheduler() -> SchedulerRunner:
+    """Start the scheduler thread, if it has not already been started.
+
+    Returns:
+        SchedulerRunner: The scheduler thread.
     """
-    scheduler.enter(10, 1, keep_alive)
-    #################
-    # DO NOT REMOVE #
-    #################
-    print(":)")
-    # This is terrible, but sched has forced my hand.
+    if not scheduler.is_alive():
+        scheduler.start()
+        log.info("Starting scheduler thread with ID = %s", scheduler.native_id)
+    return scheduler
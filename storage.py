@@ -0,0 +1,140 @@
+""" Persists processed COVID data and news to a local sqlite database, so the dashboard can be
+served straight away after a restart while fresh data is requested in the background.
+
+Attributes:
+    CACHE_FILENAME (str): The default sqlite database file.
+    CACHE_VARIABLE (str): The environment variable that sets the sqlite database file of the
+        dashboards persistent cache, instead of CACHE_FILENAME.
+    SCHEMA_VERSION (int): The version of the stored data format. Databases with a different
+        version are cleared rather than read.
+    log (Logger): The logger for the covid_dashboard.
+    persistent_cache (PersistentCache): The dashboards persistent cache.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import Any, Hashable, List, Optional, Tuple
+
+CACHE_FILENAME = "dashboard-cache.sqlite3"
+CACHE_VARIABLE = "COVID_DASHBOARD_CACHE"
+SCHEMA_VERSION = 1
+log = logging.getLogger("covid_dashboard")
+
+
+class PersistentCache:
+    """A JSON value store in a sqlite database, where every value belongs to a namespace and has
+    the time it was saved.
+
+    Attributes:
+        filename (str): The sqlite database file.
+    """
+
+    def __init__(self, filename: str = CACHE_FILENAME) -> None:
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.filename, timeout=10)
+        if not self._ready:
+            (version,) = connection.execute("PRAGMA user_version").fetchone()
+            if version != SCHEMA_VERSION:
+                log.warning(
+                    "Persistent cache %s has version %s, expected %s. Clearing it",
+                    self.filename,
+                    version,
+                    SCHEMA_VERSION,
+                )
+                connection.execute("DROP TABLE IF EXISTS entries")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries (namespace TEXT NOT NULL, key TEXT NOT"
+                " NULL, value TEXT NOT NULL, saved_at REAL NOT NULL, PRIMARY KEY"
+                " (namespace, key))"
+            )
+            connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            connection.commit()
+            self._ready = True
+        return connection
+
+    def save(self, namespace: str, key: Hashable, value: Any) -> None:
+        """Save a value, replacing any value with the same namespace and key.
+
+        Args:
+            namespace (str): The namespace of the value, such as "covid" or "news".
+            key (Hashable): The key of the value. Must be JSON serialisable.
+            value (Any): The value to save. Must be JSON serialisable.
+        """
+        try:
+            row = (namespace, json.dumps(key), json.dumps(value), time.time())
+            with self._lock, closing(self._connect()) as connection:
+                with connection:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", row
+                    )
+        except (sqlite3.Error, TypeError, ValueError) as error:
+            log.error(
+                "Could not save %s %s to the persistent cache: %s", namespace, key, error
+            )
+
+    def load(self, namespace: str, key: Hashable) -> Optional[Tuple[Any, float]]:
+        """Load a single value.
+
+        Args:
+            namespace (str): The namespace of the value.
+            key (Hashable): The key of the value.
+
+        Returns:
+            Optional[tuple]: The value and the time it was saved, or None if it does not exist.
+        """
+        rows = self._select(
+            "SELECT key, value, saved_at FROM entries WHERE namespace = ? AND key = ?",
+            (namespace, json.dumps(key)),
+        )
+        return rows[0][1:] if rows else None
+
+    def load_all(self, namespace: str) -> List[Tuple[Any, Any, float]]:
+        """Load every value in a namespace.
+
+        Args:
+            namespace (str): The namespace of the values.
+
+        Returns:
+            list[tuple]: The key, value and time saved of each value, with tuple keys as lists.
+        """
+        return self._select(
+            "SELECT key, value, saved_at FROM entries WHERE namespace = ?", (namespace,)
+        )
+
+    def prune(self, namespace: str, max_entries: int) -> None:
+        """Delete the least recently saved values in a namespace, so at most max_entries remain.
+
+        Args:
+            namespace (str): The namespace of the values.
+            max_entries (int): The most values to keep.
+        """
+        try:
+            with self._lock, closing(self._connect()) as connection:
+                with connection:
+                    connection.execute(
+                        "DELETE FROM entries WHERE namespace = ? AND key NOT IN (SELECT key FROM"
+                        " entries WHERE namespace = ? ORDER BY saved_at DESC LIMIT ?)",
+                        (namespace, namespace, max_entries),
+                    )
+        except sqlite3.Error as error:
+            log.error("Could not prune %s from the persistent cache: %s", namespace, error)
+
+    def _select(self, query: str, parameters: tuple) -> List[Tuple[Any, Any, float]]:
+        try:
+            with self._lock, closing(self._connect()) as connection:
+                rows = connection.execute(query, parameters).fetchall()
+        except sqlite3.Error as error:
+            log.error("Could not read from the persistent cache: %s", error)
+            return []
+        return [(json.loads(key), json.loads(value), saved_at) for key, value, saved_at in rows]
+
+
+persistent_cache = PersistentCache(os.environ.get(CACHE_VARIABLE, CACHE_FILENAME))
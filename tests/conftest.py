@@ -0,0 +1,82 @@
+import os
+import tempfile
+import pytest
+
+# Replay recorded upstream responses, so the tests do not need a network connection. Set
+# COVID_DASHBOARD_UPSTREAM=live to test against the real APIs.
+os.environ.setdefault("COVID_DASHBOARD_UPSTREAM", "replay")
+# Never read or write the dashboards persistent cache in the working directory
+os.environ["COVID_DASHBOARD_CACHE"] = os.path.join(tempfile.mkdtemp(), "cache.sqlite3")
+
+
+@pytest.fixture(autouse=True)
+def persistent_cache(tmp_path, monkeypatch):
+    """Give every test an empty persistent cache, so no test sees data persisted by another."""
+    import covid_data_handler
+    import covid_news_handling
+    from storage import PersistentCache
+
+    cache = PersistentCache(str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(covid_data_handler, "persistent_cache", cache)
+    monkeypatch.setattr(covid_news_handling, "persistent_cache", cache)
+    return cache
+
+
+class FakeCovidAPI:
+    """Answers GOV.UK COVID API requests with canned records, and records every request.
+
+    Attributes:
+        records (dict): The records of each location, or None to fail its requests.
+        default (list): The records of locations not in records.
+        requests (list): The location and day of every request, in order.
+    """
+
+    def __init__(self) -> None:
+        self.records: dict = {}
+        self.default: list = []
+        self.requests: list = []
+
+    def __call__(self, location="Exeter", location_type="ltla", day=None):
+        self.requests.append((location, day))
+        records = self.records.get(location, self.default)
+        if records is None:
+            return None
+        if day is not None:
+            records = [record for record in records if record.get("date") == day]
+        return {"data": records}
+
+    @property
+    def locations(self) -> list:
+        """The location of every request, sorted."""
+        return sorted(location for location, _ in self.requests)
+
+    @property
+    def days(self) -> list:
+        """The day of every request, or None for requests of every day."""
+        return [day for _, day in self.requests]
+
+
+@pytest.fixture
+def covid_caches(monkeypatch):
+    """Replace the COVID data caches with empty ones."""
+    import covid_data_handler
+    from cache import TTLCache
+
+    for cache in (
+        "internal_covid_data",
+        "internal_national_data",
+        "internal_local_series",
+        "unknown_areas",
+    ):
+        monkeypatch.setattr(covid_data_handler, cache, TTLCache("test"))
+
+
+@pytest.fixture
+def covid_api(monkeypatch, covid_caches):
+    """Replace the GOV.UK COVID API with a FakeCovidAPI, and the COVID data caches with empty
+    ones."""
+    import covid_data_handler
+
+    api = FakeCovidAPI()
+    monkeypatch.setattr(covid_data_handler, "covid_api_request", api)
+    return api
@@ -11,6 +11,22 @@ def client():
         yield client
 
 
+@pytest.fixture
+def frozen_clock(monkeypatch):
+    """Stop the minute in page ETags changing during a test."""
+    import app
+    from datetime import datetime
+
+    now = datetime.now()
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return now
+
+    monkeypatch.setattr(app, "datetime", FrozenDatetime)
+
+
 @pytest.mark.parametrize("url", ["/", "/index"])
 def test_get_url(client, url):
     response = client.get(url)
@@ -81,3 +97,134 @@ def test_favicon(client):
 def test_image(client):
     image = get_setting("image")
     response = client.get("/static/images/" + image)
+
+
+def test_defer_loading(monkeypatch):
+    import threading
+    import time
+    import app
+
+    release = threading.Event()
+    revalidate_data = app.revalidate_data
+    monkeypatch.setattr(
+        app, "revalidate_data", lambda *args: release.wait(5) and revalidate_data(*args)
+    )
+    deferred_app = create_app(testing=True, defer_loading=True)
+    assert app.startup_times["app_created"] is not None
+    with deferred_app.test_client() as deferred_client:
+        response = deferred_client.get("/")
+        assert response.status_code == 200
+        assert b"<em>Loading...</em>" in response.data
+        etag = response.headers["ETag"]
+        release.set()
+        deadline = time.monotonic() + 5
+        while b"<em>Loading...</em>" in response.data and time.monotonic() < deadline:
+            time.sleep(0.01)
+            response = deferred_client.get("/", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert b"<em>Loading...</em>" not in response.data
+
+
+def test_etag(client, frozen_clock, monkeypatch):
+    import app
+    from covid_data_handler import get_covid_data
+
+    monkeypatch.setattr(app, "get_dashboard_version", lambda: 1)
+    response = client.get("/")
+    etag = response.headers["ETag"]
+    cached = client.get("/", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.data == b""
+    location, nation = get_setting("location"), get_setting("nation")
+    get_covid_data(location, nation, force_update=True)
+    refreshed = client.get("/", headers={"If-None-Match": etag})
+    assert refreshed.status_code == 200
+    assert refreshed.headers["ETag"] != etag
+
+
+def test_etag_changes_with_dashboard_version(client):
+    from utils import bump_dashboard_version
+
+    etag = client.get("/").headers["ETag"]
+    bump_dashboard_version()
+    response = client.get("/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+@pytest.mark.parametrize("url", ["/api/covid", "/api/news", "/api/events"])
+def test_api(client, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.is_json
+    assert "max-age" in response.headers["Cache-Control"]
+    cached = client.get(url, headers={"If-None-Match": response.headers["ETag"]})
+    assert cached.status_code == 304
+
+
+def test_api_gzip(client):
+    import gzip
+    import json
+    from app import json_response
+
+    data = [{"title": "Title " * 20}] * 10
+    with client.application.test_request_context(headers={"Accept-Encoding": "gzip"}):
+        response = json_response(data)
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(response.get_data())) == data
+
+
+def test_metrics(client):
+    client.get("/")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain")
+    text = response.get_data(as_text=True)
+    assert 'dashboard_function_duration_seconds_count{function="render_dashboard"}' in text
+    assert 'dashboard_cache_misses_total{cache="rendered page"}' in text
+    assert "# TYPE dashboard_scheduler_lag_seconds histogram" in text
+
+
+@pytest.mark.parametrize("url", ["/area/Leeds", "/?location=Leeds&nation=England"])
+def test_area_dashboard(client, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    assert b"<strong>Leeds</strong>" in response.data
+    assert b'name="location" value="Leeds"' in response.data
+    assert response.headers["ETag"] != client.get("/").headers["ETag"]
+
+
+@pytest.mark.parametrize(
+    "url", ["/area/<script>", "/?location=Leeds&nation=France", "/area/" + "a" * 100]
+)
+def test_invalid_area(client, url):
+    assert client.get(url).status_code == 400
+
+
+def test_area_api_and_redirect(client):
+    response = client.get("/api/covid/Leeds?nation=England")
+    assert response.status_code == 200
+    assert response.get_json()["location"] == "Leeds"
+    response = client.get("/index?location=Leeds&nation=England")
+    assert response.status_code == 302
+    assert response.headers["Location"].endswith("/?location=Leeds&nation=England")
+
+
+def test_area_does_not_invalidate_other_areas(client, frozen_clock):
+    import covid_data_handler
+
+    client.get("/")
+    etag = client.get("/").headers["ETag"]
+    client.get("/area/Leeds")
+    pending = covid_data_handler.pending_areas.get(("Leeds", "England", "ltla"))
+    if pending is not None:
+        pending.result(5)
+    assert client.get("/", headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_unknown_area(client):
+    import covid_data_handler
+
+    covid_data_handler.unknown_areas.set(("Nowhereville", "England", "ltla"), True)
+    assert client.get("/area/Nowhereville").status_code == 404
+    assert client.get("/api/covid/Nowhereville").status_code == 404
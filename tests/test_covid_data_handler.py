@@ -1,11 +1,18 @@
+from cache import TTLCache
 from covid_data_handler import (
     get_covid_data,
     parse_csv_data,
     process_covid_csv_data,
+    process_covid_csv_file,
+    read_csv_columns,
     covid_api_request,
     schedule_covid_updates,
+    summarise_covid_rows,
+    sum_7days,
     update_covid_data,
+    update_covid_data_batch,
 )
+import pytest
 
 
 def test_parse_csv_data():
@@ -22,6 +29,30 @@ def test_process_covid_csv_data():
     assert total_deaths == 141_544
 
 
+def test_read_csv_columns():
+    rows = read_csv_columns("nation_2021-10-28.csv", ["date", "hospitalCases"])
+    assert next(rows) == {"date": "2021-10-28", "hospitalCases": "7019"}
+    assert sum(1 for _ in rows) == 637
+
+
+def test_process_covid_csv_file():
+    assert process_covid_csv_file("nation_2021-10-28.csv") == (240_299, 7_019, 141_544)
+
+
+def test_summarise_covid_rows_memory():
+    import tracemalloc
+
+    # An ltla file without hospital or deaths data is read to the end
+    rows = (["1", "", ""] for _ in range(200_000))
+    tracemalloc.start()
+    try:
+        assert summarise_covid_rows(rows, 0, 1, 2) == (7, None, None)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 100_000
+
+
 def test_covid_api_request():
     data = covid_api_request()
     assert isinstance(data, dict)
@@ -37,3 +68,230 @@ def test_get_covid_data():
 
 def test_update_covid_data():
     assert update_covid_data("Exeter", "England")
+
+
+def test_get_covid_data_force_update_refreshes_one_entry(covid_api, monkeypatch):
+    import covid_data_handler
+
+    updates = []
+
+    def fake_update(location, nation, location_type="ltla"):
+        updates.append(location)
+        return {"local_7day": len(updates)}
+
+    monkeypatch.setattr(covid_data_handler, "update_covid_data", fake_update)
+    get_covid_data("Leeds", "England")
+    get_covid_data("Bristol", "England")
+    get_covid_data("Leeds", "England")
+    get_covid_data("Leeds", "England", force_update=True)
+    assert updates == ["Leeds", "Bristol", "Leeds"]
+    assert get_covid_data("Bristol", "England") == {"local_7day": 2}
+
+
+def test_get_covid_data_coalesces_concurrent_misses(covid_api, monkeypatch):
+    import threading
+    import time
+    import covid_data_handler
+
+    updates = []
+
+    def fake_update(location, nation, location_type="ltla"):
+        updates.append(location)
+        time.sleep(0.05)
+        return {"local_7day": 1}
+
+    monkeypatch.setattr(covid_data_handler, "update_covid_data", fake_update)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(get_covid_data("York", "England")))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(1)
+    assert updates == ["York"]
+    assert results == [{"local_7day": 1}] * 5
+
+
+def test_update_covid_data_shares_national_request(covid_api):
+    for location in ["Exeter", "Leeds", "Bristol"]:
+        update_covid_data(location, "England")
+    assert covid_api.locations == ["Bristol", "England", "Exeter", "Leeds"]
+
+
+def test_update_covid_data_batch(covid_api):
+    day = {
+        "newCasesBySpecimenDate": 1,
+        "hospitalCases": 2,
+        "cumDailyNsoDeathsByDeathDate": 3,
+    }
+    covid_api.default = [day] * 8
+    covid_api.records["Leeds"] = None
+    data = update_covid_data_batch(["Exeter", "Leeds"], "England")
+    assert data["Exeter"]["local_7day"] == 7
+    assert data["Exeter"]["national_7day"] == 7
+    assert "Leeds" not in data
+
+
+def test_update_covid_data_batch_keeps_data_of_failed_requests(covid_api):
+    import covid_data_handler
+
+    day = {
+        "newCasesBySpecimenDate": 1,
+        "hospitalCases": 2,
+        "cumDailyNsoDeathsByDeathDate": 3,
+    }
+    covid_api.default = [day] * 8
+    cached = covid_data_handler.internal_covid_data
+    assert covid_data_handler.refresh_covid_area(["Exeter"], "England") == 1
+    seeded = cached.get(("Exeter", "England", "ltla"))
+    covid_api.records["Exeter"] = None
+    covid_api.records["England"] = None
+    assert covid_data_handler.refresh_covid_area(["Exeter"], "England") == 0
+    assert cached.get(("Exeter", "England", "ltla")) == seeded
+    # A failed national request falls back to the last national data
+    covid_api.records.pop("Exeter")
+    data = update_covid_data_batch(["Exeter"], "England", force_update=True)
+    assert data["Exeter"]["national_7day"] == seeded["national_7day"] == 7
+
+
+def test_update_covid_data_batch_isolates_failures(covid_api, monkeypatch):
+    import covid_data_handler
+
+    get_local_series = covid_data_handler.get_local_series
+
+    def fake_local_series(location, location_type="ltla"):
+        if location == "Leeds":
+            raise ValueError("Unexpected response")
+        return get_local_series(location, location_type)
+
+    cached = covid_data_handler.internal_covid_data
+    cached.set(("Leeds", "England", "ltla"), {"local_7day": 1})
+    monkeypatch.setattr(covid_data_handler, "get_local_series", fake_local_series)
+    data = update_covid_data_batch(["Exeter", "Leeds"], "England")
+    assert list(data) == ["Exeter"]
+    assert covid_data_handler.refresh_covid_area(["Exeter", "Leeds"], "England") == 1
+    assert cached.get(("Leeds", "England", "ltla")) == {"local_7day": 1}
+
+
+def test_refresh_cached_covid_data(covid_api):
+    import covid_data_handler
+
+    covid_api.default = [{"newCasesBySpecimenDate": 1}] * 8
+    cached = covid_data_handler.internal_covid_data
+    cached.set(("Leeds", "England", "ltla"), {"local_7day": None})
+    cached.set(("Cardiff", "Wales", "ltla"), {"local_7day": None})
+    updated = covid_data_handler.refresh_cached_covid_data([("Exeter", "England", "ltla")])
+    assert updated == 3
+    assert covid_api.locations == ["Cardiff", "England", "Exeter", "Leeds", "Wales"]
+    assert cached.get(("Leeds", "England", "ltla"))["local_7day"] == 7
+    assert cached.get(("Exeter", "England", "ltla"))["national_7day"] == 7
+
+
+def test_sum_7days_skip_first():
+    days = [{"cases": ""}] + [{"cases": 1}] * 9
+    assert sum_7days(days, "cases") == 7
+    assert sum_7days(days, "cases", skip_first=False) == 7
+    assert sum_7days([{"cases": 5}] + days[1:], "cases", skip_first=False) == 11
+
+
+def test_delta_update(covid_api):
+    import covid_data_handler
+    from datetime import date, timedelta
+
+    covid_api.default = [
+        {"date": (date.today() - timedelta(days=offset)).isoformat(), "hospitalCases": 1}
+        for offset in range(1, 30)
+    ]
+    full = covid_data_handler.get_local_series("Exeter")
+    assert covid_api.days == [None] and len(full) == 29
+    covid_api.requests.clear()
+    delta = covid_data_handler.get_local_series("Exeter")
+    assert None not in covid_api.days and len(covid_api.days) == 10
+    assert delta.dates == full.dates
+
+
+def test_delta_update_revises_summed_days(covid_api):
+    import covid_data_handler
+    from datetime import date, timedelta
+
+    covid_api.default = [
+        {
+            "date": (date.today() - timedelta(days=offset)).isoformat(),
+            "newCasesBySpecimenDate": 1,
+        }
+        for offset in range(1, 30)
+    ]
+    full = covid_data_handler.get_local_series("Exeter")
+    assert full.sum_7days("newCasesBySpecimenDate") == 7
+    # The oldest day in the 7 day sum is revised after it was cached
+    covid_api.default[7]["newCasesBySpecimenDate"] = 10
+    covid_api.requests.clear()
+    delta = covid_data_handler.get_local_series("Exeter")
+    assert None not in covid_api.days
+    assert delta.sum_7days("newCasesBySpecimenDate") == 16
+
+
+def test_delta_update_falls_back_to_full_request(covid_api):
+    import covid_data_handler
+    from datetime import date, timedelta
+    from covid_series import CovidSeries
+
+    covid_api.default = [{"date": date.today().isoformat(), "hospitalCases": 1}]
+    old = CovidSeries.from_records([{"date": (date.today() - timedelta(days=5)).isoformat()}])
+    assert len(covid_data_handler.covid_api_series("Exeter", "ltla", old)) == 1
+    assert covid_api.days == [None]
+
+
+def test_find_covid_data_only_caches_known_areas(covid_api, persistent_cache):
+    import covid_data_handler
+
+    covid_api.default = [{"date": "2021-10-28", "newCasesBySpecimenDate": 1}] * 8
+    covid_api.records["Nowhereville"] = []
+    cached = covid_data_handler.internal_covid_data
+    for location in ["Leeds", "Nowhereville"]:
+        assert covid_data_handler.find_covid_data(location, "England") is None
+        pending = covid_data_handler.pending_areas.get((location, "England", "ltla"))
+        if pending is not None:
+            pending.result(5)
+    assert covid_data_handler.find_covid_data("Leeds", "England")["local_7day"] == 7
+    assert covid_data_handler.is_unknown_area("Nowhereville", "England")
+    assert covid_data_handler.find_covid_data("Nowhereville", "England") is None
+    assert ("Nowhereville", "England", "ltla") not in cached
+    assert [key[0] for key, _, _ in persistent_cache.load_all("covid")] == ["Leeds"]
+
+
+@pytest.mark.parametrize("error_rate, unknown", [(1, False), (0, True)])
+def test_find_covid_data_in_replay(covid_caches, error_rate, unknown):
+    import covid_data_handler
+    from upstream import ReplayUpstream, set_upstream
+
+    previous = set_upstream(ReplayUpstream(error_rate=error_rate, seed=0))
+    try:
+        assert covid_data_handler.find_covid_data("Nowhereville", "England") is None
+        pending = covid_data_handler.pending_areas.get(("Nowhereville", "England", "ltla"))
+        if pending is not None:
+            pending.result(5)
+    finally:
+        set_upstream(previous)
+    # A failed request does not make the area unknown, only a request with no records does
+    assert covid_data_handler.is_unknown_area("Nowhereville", "England") == unknown
+
+
+def test_load_persisted_covid_data_keeps_age(monkeypatch, persistent_cache):
+    import sqlite3
+    import covid_data_handler
+
+    cached = TTLCache("test", ttl=covid_data_handler.COVID_CACHE_TTL)
+    monkeypatch.setattr(covid_data_handler, "internal_covid_data", cached)
+    persistent_cache.save("covid", ("Leeds", "England", "ltla"), {"local_7day": 1})
+    persistent_cache.save("covid", ("York", "England", "ltla"), {"local_7day": 2})
+    with sqlite3.connect(persistent_cache.filename) as connection:
+        connection.execute(
+            "UPDATE entries SET saved_at = saved_at - 7 * 86400 WHERE key LIKE '%York%'"
+        )
+    assert covid_data_handler.load_persisted_covid_data() == 2
+    assert ("Leeds", "England", "ltla") in cached
+    assert ("York", "England", "ltla") not in cached
+    assert cached.peek(("York", "England", "ltla")) == {"local_7day": 2}
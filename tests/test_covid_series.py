@@ -0,0 +1,119 @@
+from covid_data_handler import covid_csv_series
+from covid_series import CovidSeries
+
+records = [
+    {"date": "2021-10-28", "newCasesBySpecimenDate": None, "hospitalCases": 5},
+    {"date": "2021-10-27", "newCasesBySpecimenDate": 1, "hospitalCases": None},
+    {"date": "2021-10-26", "newCasesBySpecimenDate": 2, "hospitalCases": 4},
+    {"date": "2021-10-25", "newCasesBySpecimenDate": 3, "hospitalCases": 3},
+]
+
+
+def test_from_records():
+    series = CovidSeries.from_records(records)
+    assert len(series) == 4
+    assert list(series.values["newCasesBySpecimenDate"]) == [0, 1, 2, 3]
+    assert list(series.masks["hospitalCases"]) == [1, 0, 1, 1]
+    assert series.to_records()[1]["hospitalCases"] is None
+
+
+def test_from_records_memory():
+    import tracemalloc
+
+    # The columns are filled as rows are read, so the rows are never all held at once
+    rows = ({"newCasesBySpecimenDate": 1, "hospitalCases": ""} for _ in range(100_000))
+    tracemalloc.start()
+    try:
+        series = CovidSeries.from_records(rows)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert series.valid_count("newCasesBySpecimenDate") == len(series) == 100_000
+    assert peak < 8_000_000
+
+
+def test_rolling_sums():
+    series = CovidSeries.from_records(records)
+    assert list(series.rolling_sums("newCasesBySpecimenDate", 2)) == [1, 3, 5]
+    assert series.window_sum("newCasesBySpecimenDate", 1, 7) == 6
+    assert series.valid_count("newCasesBySpecimenDate") == 3
+
+
+def test_latest_valid():
+    series = CovidSeries.from_records(records)
+    assert series.latest_valid("hospitalCases") == 5
+    assert series.latest_valid("cumDailyNsoDeathsByDeathDate") is None
+
+
+def test_csv_series():
+    series = covid_csv_series("nation_2021-10-28.csv")
+    assert len(series) == 638
+    assert series.sum_7days("newCasesBySpecimenDate") == 240_299
+    assert series.latest_valid("hospitalCases") == 7_019
+    assert series.latest_valid("cumDailyNsoDeathsByDeathDate") == 141_544
+
+
+def test_rolling_means():
+    series = CovidSeries.from_records(records)
+    means = series.rolling_means("hospitalCases", 2)
+    assert list(means) == [5.0, 4.0, 3.5]
+
+
+def test_rolling_changes_and_rates():
+    series = CovidSeries.from_records(records)
+    assert list(series.rolling_changes("newCasesBySpecimenDate", 1, 1))[1:] == [
+        -0.5,
+        -1 / 3,
+    ]
+    assert list(series.rolling_rates("newCasesBySpecimenDate", 2, 200_000)) == [
+        0.5,
+        1.5,
+        2.5,
+    ]
+
+
+def test_week_on_week_change():
+    series = covid_csv_series("nation_2021-10-28.csv")
+    current = series.sum_7days("newCasesBySpecimenDate")
+    previous = series.window_sum("newCasesBySpecimenDate", 9, 7)
+    change = series.week_on_week_change("newCasesBySpecimenDate")
+    assert change == (current - previous) / previous
+
+
+def test_merge_keeps_days_missing_from_newer():
+    older = CovidSeries.from_records(records)
+    newer = CovidSeries.from_records(
+        [
+            {"date": "2021-10-29", "newCasesBySpecimenDate": 9},
+            {"date": None, "newCasesBySpecimenDate": 8},
+            {"date": "2021-10-26", "newCasesBySpecimenDate": 7},
+        ]
+    )
+    merged = older.merge(newer)
+    assert merged.dates == ["2021-10-29", "2021-10-28", "2021-10-27", "2021-10-26", "2021-10-25"]
+    assert list(merged.values["newCasesBySpecimenDate"]) == [9, 0, 1, 7, 3]
+    assert list(merged.masks["hospitalCases"]) == [0, 1, 0, 0, 1]
+    dateless = CovidSeries.from_records([{"date": None}, *records])
+    assert dateless.merge(newer).dates[0] == "2021-10-29"
+
+
+def test_rolling_rates_without_population():
+    series = CovidSeries.from_records(records)
+    assert series.rolling_rates("newCasesBySpecimenDate", 2, 0) is None
+    assert series.rolling_rates("newCasesBySpecimenDate", 2, None) is None
+
+
+def test_sum_7days_missing_values():
+    import pytest
+    from covid_data_handler import sum_7days
+
+    gap = [
+        {"date": "2021-10-28", "newCasesBySpecimenDate": 5},
+        {"date": "2021-10-27", "newCasesBySpecimenDate": 1},
+        {"date": "2021-10-26", "newCasesBySpecimenDate": ""},
+        {"date": "2021-10-25", "newCasesBySpecimenDate": 2},
+    ]
+    # The series counts the missing value as 0, where the row by row sum raises
+    assert CovidSeries.from_records(gap).sum_7days("newCasesBySpecimenDate") == 3
+    with pytest.raises(ValueError):
+        sum_7days(gap, "newCasesBySpecimenDate")
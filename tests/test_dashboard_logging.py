@@ -0,0 +1,77 @@
+import logging
+import time
+import pytest
+from dashboard_logging import BufferedRotatingFileHandler, LogPipeline
+
+
+def test_buffered_handler_writes_in_batches(tmp_path):
+    filename = tmp_path / "test.log"
+    handler = BufferedRotatingFileHandler(str(filename), batch_size=3)
+    logger = logging.getLogger("test_batches")
+    logger.propagate = False
+    logger.addHandler(handler)
+    logger.warning("one")
+    logger.warning("two")
+    assert not filename.exists()
+    logger.warning("three")
+    assert filename.read_text().splitlines() == ["one", "two", "three"]
+    logger.error("error")
+    assert handler.batches == 2
+    logger.warning("buffered")
+    handler.close()
+    logger.removeHandler(handler)
+    assert filename.read_text().splitlines()[-1] == "buffered"
+
+
+def test_buffered_handler_rotation(tmp_path):
+    filename = tmp_path / "test.log"
+    handler = BufferedRotatingFileHandler(str(filename), max_bytes=10, batch_size=1)
+    record = logging.makeLogRecord({"msg": "0123456789", "levelno": logging.INFO})
+    handler.handle(record)
+    handler.handle(record)
+    assert (tmp_path / "test.log.1").exists()
+    handler.rollover_at = time.time()
+    handler.handle(record)
+    assert (tmp_path / "test.log.2").exists()
+    handler.close()
+
+
+def test_log_pipeline(tmp_path):
+    filename = tmp_path / "test.log"
+    logger = logging.getLogger("test_pipeline")
+    logger.propagate = False
+    pipeline = LogPipeline(str(filename), "production").attach(logger)
+    logger.info("Requested /")
+    logger.warning("Slow request to %s", "/")
+    pipeline.detach(logger)
+    lines = filename.read_text().splitlines()
+    assert len(lines) == 1 and "Slow request to /" in lines[0]
+    stats = pipeline.stats()
+    assert stats["records"] == 1 and stats["dropped"] == 0
+    assert stats["mean_enqueue_time"] > 0
+
+
+def test_unknown_preset():
+    with pytest.raises(ValueError):
+        LogPipeline("test.log", "unknown")
+
+
+def test_queue_handler_counters_from_many_threads():
+    import queue
+    import threading
+    from dashboard_logging import NonBlockingQueueHandler
+
+    handler = NonBlockingQueueHandler(queue.Queue(100))
+    record = logging.makeLogRecord({"msg": "Requested /", "levelno": logging.INFO})
+
+    def log_records():
+        for _ in range(500):
+            handler.emit(record)
+
+    threads = [threading.Thread(target=log_records) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    records, dropped, enqueue_time = handler.counters()
+    assert records == 4000 and dropped == 3900 and enqueue_time > 0
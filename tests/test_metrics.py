@@ -0,0 +1,60 @@
+import pytest
+from metrics import Counter, Histogram, Registry, timed
+
+
+def test_counter():
+    registry = Registry()
+    counter = Counter("requests", "Requests made.", ("upstream",), metrics_registry=registry)
+    counter.inc(upstream="news_api")
+    counter.inc(2, upstream="news_api")
+    assert counter.value(upstream="news_api") == 3
+    assert 'requests_total{upstream="news_api"} 3' in registry.render()
+    with pytest.raises(ValueError):
+        counter.inc(location="Exeter")
+    with pytest.raises(ValueError):
+        Counter("requests", "Duplicate.", metrics_registry=registry)
+
+
+def test_histogram():
+    registry = Registry()
+    histogram = Histogram(
+        "duration_seconds", "Durations.", buckets=(0.1, 1), metrics_registry=registry
+    )
+    for value in (0.05, 0.1, 0.5, 2):
+        histogram.observe(value)
+    lines = registry.render().splitlines()
+    assert lines[:2] == [
+        "# HELP duration_seconds Durations.",
+        "# TYPE duration_seconds histogram",
+    ]
+    assert lines[2:] == [
+        'duration_seconds_bucket{le="0.1"} 2',
+        'duration_seconds_bucket{le="1"} 3',
+        'duration_seconds_bucket{le="+Inf"} 4',
+        "duration_seconds_sum 2.65",
+        "duration_seconds_count 4",
+    ]
+
+
+def test_timed():
+    registry = Registry()
+    histogram = Histogram("calls_seconds", "Calls.", ("function",), metrics_registry=registry)
+
+    @timed(histogram, function="fail")
+    def fail():
+        raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        fail()
+    with histogram.time(function="block"):
+        pass
+    assert histogram.count(function="fail") == 1
+    assert histogram.count(function="block") == 1
+
+
+def test_collector():
+    registry = Registry()
+    registry.add_collector(
+        lambda: [("size", "gauge", "Size.", [("size", {"cache": 'a"b'}, None)])]
+    )
+    assert 'size{cache="a\\"b"} NaN' in registry.render()
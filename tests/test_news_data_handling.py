@@ -1,4 +1,11 @@
-from covid_news_handling import get_news, news_API_request, remove_article, update_news
+from covid_news_handling import (
+    get_news,
+    merge_news,
+    news_API_request,
+    remove_article,
+    render_article,
+    update_news,
+)
 
 
 def test_news_API_request():
@@ -12,3 +19,42 @@ def test_update_news():
 
 def test_get_news():
     assert get_news()
+
+
+def article(url, published_at, title="Title"):
+    return {
+        "title": title,
+        "description": "Description",
+        "url": url,
+        "publishedAt": published_at,
+    }
+
+
+def test_merge_news():
+    current = [article("b", "2021-12-02T10:00:00Z"), article("a", "2021-12-01T10:00:00Z")]
+    new = [article("c", "2021-12-03T10:00:00Z"), article("b", "2021-12-02T10:00:00Z", "New")]
+    merged = merge_news(new, current)
+    assert [item["url"] for item in merged] == ["c", "b", "a"]
+    assert merged[1]["title"] == "New"
+
+
+def test_update_news_incremental(monkeypatch):
+    import covid_news_handling
+
+    requests_from = []
+
+    def fake_request(covid_terms="Covid COVID-19 coronavirus", published_from=None):
+        requests_from.append(published_from)
+        return [article("c", "2021-12-03T10:00:00Z")]
+
+    monkeypatch.setattr(covid_news_handling, "news_API_request", fake_request)
+    current = [article("a", "2021-12-01T10:00:00Z"), article("b", "2021-12-02T10:00:00Z")]
+    updated = update_news(current_news=current)
+    assert requests_from == ["2021-12-02T10:00:00Z"]
+    assert [item["url"] for item in updated] == ["c", "b", "a"]
+
+
+def test_render_article():
+    rendered = render_article(article("https://example.com", "2021-12-01T10:30:00Z"))
+    assert rendered["content"].startswith("<u>10:30 AM 01/12/21</u><br>Description")
+    assert "href='https://example.com'" in rendered["content"]
@@ -1,5 +1,6 @@
-from scheduler import call_event, keep_alive, remove_event, schedule_event
+from scheduler import call_event, remove_event, schedule_event
 from datetime import timedelta
+import time
 
 
 def test_schedule_event():
@@ -14,5 +15,163 @@ def test_remove_event():
     remove_event("pytest")
 
 
-def test_keep_alive():
-    keep_alive()
+def test_scheduler_runner(monkeypatch):
+    import scheduler
+
+    ran = []
+    monkeypatch.setattr(
+        scheduler, "call_event", lambda label, *args, **kwargs: ran.append(label)
+    )
+    events = scheduler.EventRegistry()
+    runner = scheduler.SchedulerRunner(events)
+    runner.start()
+    events.add(
+        {
+            "title": "soon",
+            "target_time": timedelta(),
+            "repeat": False,
+            "data": False,
+            "news": False,
+            "run_at": time.time() + 0.05,
+        }
+    )
+    runner.wake()
+    time.sleep(0.3)
+    runner.stop()
+    runner.join(1)
+    assert ran == ["soon"]
+    assert runner.stats()["events_run"] == 1
+    assert runner.stats()["max_lag"] < 0.2
+
+
+def test_event_registry_order():
+    from scheduler import EventRegistry
+
+    registry = EventRegistry()
+    for title, run_at in [("b", 2), ("a", 1), ("c", 3)]:
+        registry.add({"title": title, "run_at": run_at})
+    assert [event["title"] for event in registry] == ["a", "b", "c"]
+    assert registry.next_event()["title"] == "a"
+    registry.remove("a")
+    assert "a" not in registry
+    assert registry.next_event()["title"] == "b"
+    registry.add({"title": "b", "run_at": 4})
+    assert registry.next_event()["title"] == "c"
+    assert len(registry) == 2
+    assert registry.pop_due(2.5) == (None, 0.5)
+    event, lag = registry.pop_due(3.5)
+    assert event["title"] == "c" and lag == 0.5
+
+
+def test_cancel_event():
+    from scheduler import cancel_event, scheduled_events
+
+    schedule_event(timedelta(hours=3), "pytest cancel", False, True, False)
+    assert cancel_event("pytest cancel")
+    assert not cancel_event("pytest cancel")
+    assert "pytest cancel" not in scheduled_events
+
+
+def test_job_pool_coalesces_in_flight_jobs():
+    import threading
+    from scheduler import JobPool
+
+    release = threading.Event()
+    calls = []
+
+    def job(name):
+        calls.append(name)
+        release.wait(1)
+        return name
+
+    pool = JobPool(max_workers=2)
+    first = pool.submit("covid", ("Exeter", "England"), job, "first")
+    second = pool.submit("covid", ("Exeter", "England"), job, "second")
+    other = pool.submit("news", None, job, "news")
+    assert second is first
+    assert len(pool.in_flight()) == 2
+    release.set()
+    assert first.result(1) == "first" and other.result(1) == "news"
+    assert sorted(calls) == ["first", "news"]
+    stats = pool.stats()["covid"]
+    assert stats["submitted"] == 1 and stats["coalesced"] == 1
+    assert stats["completed"] == 1 and stats["execution_time_max"] > 0
+    assert stats["queue_delay_mean"] is not None
+
+
+def test_job_pool_timeout_and_failure():
+    import threading
+    import pytest
+    from scheduler import JobPool
+
+    release = threading.Event()
+    pool = JobPool(max_workers=2, timeout=0.05)
+    slow = pool.submit("news", "Covid", release.wait, 1)
+    with pytest.raises(TimeoutError):
+        slow.result(1)
+    assert pool.in_flight() == []
+    retry = pool.submit("news", "Covid", lambda: 1 / 0)
+    assert retry is not slow
+    assert retry.result(1) is None
+    release.set()
+    stats = pool.stats()["news"]
+    assert stats["timeouts"] == 1 and stats["failures"] == 1 and stats["submitted"] == 2
+
+
+def test_job_pool_waits_for_a_place_in_the_queue():
+    import threading
+    from scheduler import JobPool
+
+    release = threading.Event()
+    pool = JobPool(max_workers=1, queue_size=1)
+    first = pool.submit("covid", "England", release.wait, 1)
+    started = time.monotonic()
+    threading.Timer(0.1, release.set).start()
+    second = pool.submit("covid", "Wales", lambda: "Wales")
+    assert time.monotonic() - started >= 0.09
+    assert first.result(1) is True and second.result(1) == "Wales"
+
+
+def test_repeating_event_runs_once_per_occurrence(monkeypatch):
+    import scheduler
+
+    submitted = []
+
+    class FakeJobPool:
+        def submit(self, kind, key, func, *args, **kwargs):
+            submitted.append(kind)
+
+    events = scheduler.EventRegistry()
+    runner = scheduler.SchedulerRunner(events)
+    monkeypatch.setattr(scheduler, "scheduled_events", events)
+    monkeypatch.setattr(scheduler, "scheduler", runner)
+    monkeypatch.setattr(scheduler, "job_pool", FakeJobPool())
+    run_at = time.time() + 0.05
+    events.add(
+        {
+            "title": "repeating",
+            "target_time": timedelta(),
+            "repeat": True,
+            "data": False,
+            "news": True,
+            "run_at": run_at,
+        }
+    )
+    runner.start()
+    time.sleep(0.3)
+    runner.stop()
+    runner.join(1)
+    assert submitted == ["news"]
+    assert events.get("repeating")["run_at"] == run_at + scheduler.REPEAT_INTERVAL
+
+
+def test_schedule_event_at_current_time(monkeypatch):
+    import scheduler
+    from datetime import datetime
+
+    monkeypatch.setattr(scheduler, "scheduled_events", scheduler.EventRegistry())
+    now = datetime.now()
+    target_time = timedelta(hours=now.hour, minutes=now.minute, seconds=now.second)
+    schedule_event(target_time, "pytest now", True, False, False)
+    run_at = scheduler.scheduled_events.get("pytest now")["run_at"]
+    assert run_at > time.time() + scheduler.REPEAT_INTERVAL - 2
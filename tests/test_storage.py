@@ -0,0 +1,33 @@
+import sqlite3
+from storage import PersistentCache, SCHEMA_VERSION
+
+
+def test_save_and_load(tmp_path):
+    cache = PersistentCache(str(tmp_path / "cache.sqlite3"))
+    assert cache.load("covid", ["Exeter", "England", "ltla"]) is None
+    cache.save("covid", ("Exeter", "England", "ltla"), {"local_7day": 1})
+    cache.save("news", "Covid", [{"title": "Title"}])
+    value, saved_at = cache.load("covid", ["Exeter", "England", "ltla"])
+    assert value == {"local_7day": 1}
+    assert saved_at > 0
+    assert [key for key, _, _ in cache.load_all("news")] == ["Covid"]
+
+
+def test_version_mismatch_clears_cache(tmp_path):
+    filename = str(tmp_path / "cache.sqlite3")
+    PersistentCache(filename).save("news", "Covid", [])
+    connection = sqlite3.connect(filename)
+    connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION + 1}")
+    connection.close()
+    assert PersistentCache(filename).load_all("news") == []
+
+
+def test_prune(tmp_path):
+    cache = PersistentCache(str(tmp_path / "cache.sqlite3"))
+    for location in ["Exeter", "Leeds", "York"]:
+        cache.save("covid", (location, "England", "ltla"), {})
+    cache.save("news", "Covid", [])
+    cache.prune("covid", 2)
+    assert len(cache.load_all("covid")) == 2
+    assert cache.load("covid", ["York", "England", "ltla"]) is not None
+    assert cache.load_all("news") != []
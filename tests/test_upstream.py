@@ -0,0 +1,86 @@
+import json
+from datetime import date
+import pytest
+import requests
+import upstream
+from covid_data_handler import covid_api_request
+from covid_news_handling import news_API_request
+from upstream import LiveUpstream, ReplayUpstream, set_upstream, upstream_from_environment
+
+STRUCTURE = {"date": "date", "cases": "newCasesBySpecimenDate"}
+
+
+def test_replay_covid_from_csv():
+    replay = ReplayUpstream(fixtures=None)
+    response = replay.covid(["areaType=nation", "areaName=England"], STRUCTURE)
+    assert response["length"] == 638
+    assert response["data"][0] == {"date": date.today().isoformat(), "cases": None}
+    day = response["data"][3]["date"]
+    filtered = replay.covid(["areaType=nation", "areaName=England", f"date={day}"], STRUCTURE)
+    assert filtered["data"] == [response["data"][3]]
+
+
+def test_replay_covid_from_fixtures():
+    replay = ReplayUpstream(rebase_dates=False)
+    response = replay.covid(["areaType=ltla", "areaName=Exeter"], STRUCTURE)
+    assert response["length"] == 28
+    assert response["data"][0]["date"] == "2021-10-28"
+
+
+def test_replay_covid_unknown_area():
+    replay = ReplayUpstream(fixtures=None)
+    response = replay.covid(["areaType=ltla", "areaName=Nowhereville"], STRUCTURE)
+    assert response["data"] == []
+
+
+def test_replay_news(tmp_path):
+    fixtures = tmp_path / "fixtures.json"
+    fixtures.write_text(
+        json.dumps(
+            {
+                "news": [
+                    {"title": "New", "publishedAt": "2021-12-02T10:00:00Z"},
+                    {"title": "Old", "publishedAt": "2021-12-01T10:00:00Z"},
+                ]
+            }
+        )
+    )
+    replay = ReplayUpstream(fixtures=str(fixtures))
+    response = replay.news("https://newsapi.org/v2/everything?q=Covid&pageSize=1", 30)
+    assert response.status_code == 200
+    assert [article["title"] for article in response.json()["articles"]] == ["New"]
+    response = replay.news("https://newsapi.org/v2/everything?q=Covid&from=2021-12-02", 30)
+    assert len(response.json()["articles"]) == 1
+
+
+def test_replay_error_injection():
+    replay = ReplayUpstream(error_rate=1, latency=0.01, seed=0)
+    previous = set_upstream(replay)
+    try:
+        assert covid_api_request() is None
+        assert news_API_request() == []
+    finally:
+        set_upstream(previous)
+    assert replay.stats() == {"calls": 2, "errors": 2}
+    with pytest.raises(requests.exceptions.ConnectionError):
+        replay.covid([], STRUCTURE)
+
+
+def test_upstream_from_environment(monkeypatch):
+    monkeypatch.setenv("COVID_DASHBOARD_UPSTREAM", "live")
+    assert isinstance(upstream_from_environment(), LiveUpstream)
+    monkeypatch.setenv("COVID_DASHBOARD_UPSTREAM", "replay")
+    monkeypatch.setenv("COVID_DASHBOARD_REPLAY_ERROR_RATE", "0.5")
+    replay = upstream_from_environment()
+    assert isinstance(replay, ReplayUpstream) and replay.error_rate == 0.5
+    monkeypatch.setenv("COVID_DASHBOARD_UPSTREAM", "unknown")
+    with pytest.raises(ValueError):
+        upstream_from_environment()
+    assert upstream.get_upstream().name == "replay"
+
+
+def test_upstream_is_abstract():
+    from upstream import Upstream
+
+    with pytest.raises(TypeError):
+        Upstream()  # pylint: disable=abstract-class-instantiated
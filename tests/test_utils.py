@@ -4,6 +4,7 @@ from utils import (
     get_news_blacklist,
     get_setting,
     get_settings,
+    reload_settings,
     sanitise_input,
     time_until,
 )
@@ -17,6 +18,25 @@ def test_get_setting():
     assert get_setting("nation")
 
 
+def test_settings_reload_on_change(tmp_path, monkeypatch):
+    import json
+    import os
+    import utils
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(utils, "SETTINGS_CHECK_INTERVAL", 0)
+    monkeypatch.setattr(
+        utils, "settings_cache", {"config": None, "signature": None, "checked_at": 0}
+    )
+    assert get_setting("location") == "Exeter"
+    config = dict(utils.DEFAULT_CONFIG, location="Leeds")
+    with open("config.json", "w", encoding="utf-8") as file:
+        json.dump(config, file)
+    os.utime("config.json", ns=(0, 0))
+    assert get_setting("location") == "Leeds"
+    assert reload_settings()["location"] == "Leeds"
+
+
 def test_time_until():
     assert time_until(timedelta(hours=5))
 
@@ -25,5 +45,33 @@ def test_get_news_blacklist():
     get_news_blacklist()
 
 
+def test_news_blacklist_journal(tmp_path, monkeypatch):
+    import json
+    import utils
+
+    monkeypatch.setattr(utils, "BLACKLIST_COMPACT_THRESHOLD", 2)
+    snapshot = str(tmp_path / "news-blacklist.json")
+    journal = str(tmp_path / "news-blacklist.journal")
+    news_blacklist = utils.NewsBlacklist(snapshot, journal)
+    news_blacklist.add("First")
+    news_blacklist.add("Second")
+    news_blacklist.add("First")
+    assert "Second" in news_blacklist
+    assert utils.NewsBlacklist(snapshot, journal).titles() == ["First", "Second"]
+    news_blacklist.add("Third")
+    with open(snapshot, encoding="utf-8") as file:
+        assert json.load(file) == {"blacklist": ["First", "Second", "Third"]}
+    with open(journal, encoding="utf-8") as file:
+        assert file.read() == ""
+
+
 def test_sanitise_input():
     assert sanitise_input("Test<script>alert(1)</script>Test") == "Testalert(1)Test"
+
+
+def test_sanitise_input_fast_path():
+    sanitise_input.cache_clear()
+    assert sanitise_input("No markup here") == "No markup here"
+    assert sanitise_input("Fish &amp; chips") == "Fish & chips"
+    assert sanitise_input("Fish &amp; chips") == "Fish & chips"
+    assert sanitise_input.cache_info().hits == 1
@@ -0,0 +1,286 @@
+""" The upstream APIs the dashboard gets its data from. The GOV.UK COVID API and NewsAPI.org are
+used by default, but can be replaced with a local replay of recorded responses, so the dashboard
+can be tested, profiled and benchmarked without a network connection.
+
+The upstream is chosen when the dashboard starts, from these environment variables:
+
+    COVID_DASHBOARD_UPSTREAM: "live" (the default) or "replay".
+    COVID_DASHBOARD_REPLAY_FIXTURES: The replay fixtures file. Defaults to REPLAY_FIXTURES.
+    COVID_DASHBOARD_REPLAY_LATENCY: Seconds each replayed request takes. Defaults to 0.
+    COVID_DASHBOARD_REPLAY_ERROR_RATE: The fraction of replayed requests that fail. Defaults to 0.
+
+Attributes:
+    NEWS_API_URL (str): The NewsAPI.org endpoint articles are requested from.
+    REPLAY_CSV (str): The csv file COVID data is replayed from, for nations without fixtures.
+    REPLAY_FIXTURES (str): The default replay fixtures file.
+    log (Logger): The logger for the covid_dashboard.
+    active_upstream (Upstream): The upstream requests are currently made to.
+"""
+import csv
+import json
+import logging
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import date
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+import requests
+import uk_covid19
+
+NEWS_API_URL = "https://newsapi.org/v2/everything"
+REPLAY_CSV = "nation_2021-10-28.csv"
+REPLAY_FIXTURES = "upstream_fixtures.json"
+log = logging.getLogger("covid_dashboard")
+
+
+class Upstream(ABC):
+    """The requests the dashboard makes to its upstream APIs.
+
+    Attributes:
+        name (str): The name of the upstream, used when logging.
+    """
+
+    name = "upstream"
+
+    @abstractmethod
+    def covid(self, filters: List[str], structure: Dict[str, str]) -> dict:
+        """Request COVID data, in the format of the GOV.UK COVID API.
+
+        Args:
+            filters (list[str]): Filters such as "areaName=Exeter" and "date=2021-10-28".
+            structure (dict[str, str]): The name of each returned value, and the metric it is.
+
+        Raises:
+            uk_covid19.exceptions.FailedRequestError: If the API responds with an error.
+            requests.exceptions.RequestException: If the request fails.
+
+        Returns:
+            dict: The response, with one record for each day in its "data".
+        """
+
+    @abstractmethod
+    def news(self, url: str, timeout: float) -> requests.Response:
+        """Request news articles from NewsAPI.org.
+
+        Args:
+            url (str): The request URL, including its query.
+            timeout (float): How many seconds to wait for a response.
+
+        Raises:
+            requests.exceptions.RequestException: If the request fails.
+
+        Returns:
+            Response: The HTTP response.
+        """
+
+
+class LiveUpstream(Upstream):
+    """Makes requests to the real GOV.UK COVID API and NewsAPI.org.
+
+    Attributes:
+        session (Session): A pooled HTTP session used for every NewsAPI.org request.
+    """
+
+    name = "live"
+
+    def __init__(self) -> None:
+        self.session = requests.Session()
+
+    def covid(self, filters: List[str], structure: Dict[str, str]) -> dict:
+        return uk_covid19.Cov19API(filters=filters, structure=structure).get_json()
+
+    def news(self, url: str, timeout: float) -> requests.Response:
+        return self.session.get(url, timeout=timeout)
+
+
+class ReplayUpstream(Upstream):
+    """Replays recorded responses instead of making requests, with optional latency and errors
+    so the dashboard can be tested under realistic upstream behaviour.
+
+    COVID data is replayed from the fixtures "covid" records of an area if there are any,
+    otherwise from the bundled csv file for nations. Other areas without fixtures have no data,
+    as unknown areas do in the live API. News articles are replayed from the fixtures "news"
+    articles, whatever the search terms.
+
+    Attributes:
+        latency (float): Seconds each request takes.
+        jitter (float): Up to this many seconds are randomly added to the latency.
+        error_rate (float): The fraction of requests that fail with a ConnectionError.
+        calls (int): The number of requests made.
+        errors (int): The number of requests that failed.
+    """
+
+    name = "replay"
+
+    def __init__(
+        self,
+        fixtures: Optional[str] = REPLAY_FIXTURES,
+        csv_filename: str = REPLAY_CSV,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        rebase_dates: bool = True,
+        seed: Optional[int] = None,
+    ) -> None:
+        """
+        Args:
+            fixtures (Optional[str], optional): The fixtures file, a JSON object with "covid"
+                records by area name and a list of "news" articles. Defaults to REPLAY_FIXTURES.
+            csv_filename (str, optional): The csv file COVID data is replayed from for nations
+                without fixtures. Defaults to REPLAY_CSV.
+            latency (float, optional): Seconds each request takes. Defaults to 0.
+            jitter (float, optional): Up to this many seconds are randomly added to the
+                latency. Defaults to 0.
+            error_rate (float, optional): The fraction of requests that fail. Defaults to 0.
+            rebase_dates (bool, optional): Move the dates of the COVID data so the most recent
+                is today, as it would be from the live API. Defaults to True.
+            seed (Optional[int], optional): Seeds the random latency and errors.
+                Defaults to None.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rebase_dates = rebase_dates
+        self.calls = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._csv_filename = csv_filename
+        self._csv_records: Optional[List[dict]] = None
+        loaded = {}
+        if fixtures is not None:
+            with open(fixtures, encoding="utf-8") as file:
+                loaded = json.load(file)
+        self._covid = {
+            area: self._rebase(records) for area, records in loaded.get("covid", {}).items()
+        }
+        self._news = loaded.get("news", [])
+
+    def covid(self, filters: List[str], structure: Dict[str, str]) -> dict:
+        self._simulate("COVID API")
+        values = dict(item.split("=", 1) for item in filters)
+        records = self._covid.get(values.get("areaName"))
+        if records is None:
+            is_nation = values.get("areaType", "").lower() == "nation"
+            records = self._load_csv() if is_nation else []
+        if "date" in values:
+            records = [record for record in records if record["date"] == values["date"]]
+        data = [
+            {name: record.get(metric) for name, metric in structure.items()} for record in records
+        ]
+        return {"data": data, "length": len(data), "totalPages": 1}
+
+    def news(self, url: str, timeout: float) -> requests.Response:
+        self._simulate("NewsAPI.org")
+        query = parse_qs(urlsplit(url).query)
+        articles = self._news
+        if "from" in query:
+            articles = [
+                article for article in articles if article["publishedAt"] >= query["from"][0]
+            ]
+        if "pageSize" in query:
+            articles = articles[: int(query["pageSize"][0])]
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.url = url
+        response._content = json.dumps(  # pylint: disable=protected-access
+            {"status": "ok", "totalResults": len(articles), "articles": articles}
+        ).encode("utf-8")
+        return response
+
+    def stats(self) -> dict:
+        """Get the number of replayed requests and injected errors.
+
+        Returns:
+            dict: The calls and errors.
+        """
+        with self._lock:
+            return {"calls": self.calls, "errors": self.errors}
+
+    def _simulate(self, upstream: str) -> None:
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if delay > 0:
+            time.sleep(delay)
+        if failed:
+            raise requests.exceptions.ConnectionError(f"Injected {upstream} replay error")
+
+    def _load_csv(self) -> List[dict]:
+        with self._lock:
+            if self._csv_records is None:
+                with open(self._csv_filename, encoding="utf-8", newline="") as file:
+                    self._csv_records = self._rebase(
+                        [
+                            {
+                                key: int(value) if value.isdigit() else (value or None)
+                                for key, value in row.items()
+                            }
+                            for row in csv.DictReader(file)
+                        ]
+                    )
+            return self._csv_records
+
+    def _rebase(self, records: List[dict]) -> List[dict]:
+        if not self.rebase_dates or not records:
+            return records
+        offset = date.today() - date.fromisoformat(records[0]["date"])
+        return [
+            {**record, "date": (date.fromisoformat(record["date"]) + offset).isoformat()}
+            for record in records
+        ]
+
+
+def upstream_from_environment() -> Upstream:
+    """Create the upstream chosen by the COVID_DASHBOARD_UPSTREAM environment variables.
+
+    Raises:
+        ValueError: If COVID_DASHBOARD_UPSTREAM is not "live" or "replay".
+
+    Returns:
+        Upstream: The upstream.
+    """
+    name = os.environ.get("COVID_DASHBOARD_UPSTREAM", "live")
+    if name == "live":
+        return LiveUpstream()
+    if name == "replay":
+        return ReplayUpstream(
+            fixtures=os.environ.get("COVID_DASHBOARD_REPLAY_FIXTURES", REPLAY_FIXTURES),
+            latency=float(os.environ.get("COVID_DASHBOARD_REPLAY_LATENCY", 0)),
+            error_rate=float(os.environ.get("COVID_DASHBOARD_REPLAY_ERROR_RATE", 0)),
+        )
+    raise ValueError(f"Unknown upstream {name}, expected live or replay")
+
+
+def get_upstream() -> Upstream:
+    """Get the upstream requests are currently made to.
+
+    Returns:
+        Upstream: The active upstream.
+    """
+    return active_upstream
+
+
+def set_upstream(upstream: Upstream) -> Upstream:
+    """Make every following request to a different upstream.
+
+    Args:
+        upstream (Upstream): The new upstream.
+
+    Returns:
+        Upstream: The previous upstream.
+    """
+    global active_upstream
+    previous, active_upstream = active_upstream, upstream
+    log.info("Using the %s upstream", upstream.name)
+    return previous
+
+
+active_upstream = upstream_from_environment()
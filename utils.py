@@ -2,14 +2,31 @@
 timing functions and storing the users blacklist.
 
 Attributes:
+    SETTINGS_CHECK_INTERVAL (float): The minimum number of seconds between checks of config.json
+        for changes.
+    settings_cache (dict): The last loaded config, the signature of the file it was loaded from,
+        and when the file was last checked.
+    settings_lock (Lock): Guards settings_cache.
+    version_lock (Lock): Guards dashboard_version and area_versions.
+    BLACKLIST_COMPACT_THRESHOLD (int): How many titles the news blacklist journal can hold before
+        it is compacted into news-blacklist.json.
+    news_blacklist (NewsBlacklist): The users news blacklist.
+    SANITISE_CACHE_SIZE (int): How many sanitised strings are cached.
+    dashboard_version (int): Increased whenever anything shown on every area's dashboard changes.
+    area_versions (dict): Increased whenever the COVID data of one area changes, keyed on the
+        area.
     log (Logger): The logger for the covid_dashboard.
 """
 import json
 import logging
+import os
+import threading
+import time
 from datetime import datetime, timedelta
+from functools import lru_cache
 from io import StringIO
 from html.parser import HTMLParser
-from typing import Any
+from typing import Any, Hashable, Optional
 
 DEFAULT_CONFIG = {
     "favicon": "/static/images/fish.gif",
@@ -19,7 +36,15 @@ DEFAULT_CONFIG = {
     "nation": "England",
     "api_key": "INSERT-API-KEY-HERE",
 }
+SETTINGS_CHECK_INTERVAL = 1.0
+BLACKLIST_COMPACT_THRESHOLD = 1000
+SANITISE_CACHE_SIZE = 1024
 log = logging.getLogger("covid_dashboard")
+settings_cache: dict = {"config": None, "signature": None, "checked_at": 0.0}
+settings_lock = threading.Lock()
+dashboard_version: int = 0
+area_versions: dict = {}
+version_lock = threading.Lock()
 
 
 def get_settings(*keys) -> tuple:
@@ -31,28 +56,70 @@ def get_settings(*keys) -> tuple:
     Returns:
         tuple: The values for each given settings from the users config.json
     """
-    try:
-        with open("config.json", encoding="utf-8") as file:
-            log.info("Loading config.json")
-            config = json.load(file)
-    except FileNotFoundError:
-        log.warning(
-            "No config.json found, creating a new config.json with default values"
-        )
-        config = DEFAULT_CONFIG
-        with open("config.json", "w", encoding="utf-8") as file:
-            json.dump(config, file, ensure_ascii=False, indent=4)
+    config = load_settings()
     result = []
-    if (config["api_key"] == "INSERT-API-KEY-HERE") or (config["api_key"] is None):
-        log.warning(
-            "No NewsAPI.org API key found in config, get one from"
-            " https://newsapi.org/register"
-        )
     for key in keys:
         result.append(config[key])
     return tuple(result)
 
 
+def load_settings(force_reload: bool = False) -> dict:
+    """Get the users config.json from memory, only reading it again if the file has been replaced
+    or modified. The file is checked at most once every SETTINGS_CHECK_INTERVAL seconds.
+
+    Args:
+        force_reload (bool, optional): Read config.json even if it has not changed.
+            Defaults to False.
+
+    Returns:
+        dict: The users config.
+    """
+    now = time.monotonic()
+    with settings_lock:
+        config = settings_cache["config"]
+        if (
+            config is not None
+            and not force_reload
+            and now - settings_cache["checked_at"] < SETTINGS_CHECK_INTERVAL
+        ):
+            return config
+        settings_cache["checked_at"] = now
+        try:
+            stat = os.stat("config.json")
+        except FileNotFoundError:
+            log.warning(
+                "No config.json found, creating a new config.json with default values"
+            )
+            with open("config.json", "w", encoding="utf-8") as file:
+                json.dump(DEFAULT_CONFIG, file, ensure_ascii=False, indent=4)
+            stat = os.stat("config.json")
+        signature = (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        unchanged = signature == settings_cache["signature"]
+        if config is not None and not force_reload and unchanged:
+            return config
+        with open("config.json", encoding="utf-8") as file:
+            log.info("Loading config.json")
+            config = json.load(file)
+        if (config["api_key"] == "INSERT-API-KEY-HERE") or (config["api_key"] is None):
+            log.warning(
+                "No NewsAPI.org API key found in config, get one from"
+                " https://newsapi.org/register"
+            )
+        settings_cache["config"] = config
+        settings_cache["signature"] = signature
+        bump_dashboard_version()
+        return config
+
+
+def reload_settings() -> dict:
+    """Read the users config.json again, even if it has not changed.
+
+    Returns:
+        dict: The users config.
+    """
+    return load_settings(force_reload=True)
+
+
 def get_setting(key: str) -> Any:
     """Get a single setting from the users config.json
 
@@ -66,6 +133,54 @@ def get_setting(key: str) -> Any:
     return result[0]
 
 
+def get_dashboard_version() -> int:
+    """Get the current version of the dashboard data, news, settings and scheduled events.
+
+    Returns:
+        int: The dashboard version.
+    """
+    return dashboard_version
+
+
+def bump_dashboard_version() -> int:
+    """Increase the dashboard version, when anything shown on the dashboard changes.
+
+    Returns:
+        int: The new dashboard version.
+    """
+    global dashboard_version
+    with version_lock:
+        dashboard_version += 1
+        return dashboard_version
+
+
+def get_area_version(area: Hashable) -> int:
+    """Get the current version of the COVID data of one area.
+
+    Args:
+        area (Hashable): The area, such as (location, nation, location_type).
+
+    Returns:
+        int: The area version.
+    """
+    return area_versions.get(area, 0)
+
+
+def bump_area_version(area: Hashable) -> int:
+    """Increase the version of one area, when only its COVID data changes, so the dashboards of
+    other areas stay cached.
+
+    Args:
+        area (Hashable): The area, such as (location, nation, location_type).
+
+    Returns:
+        int: The new area version.
+    """
+    with version_lock:
+        area_versions[area] = area_versions.get(area, 0) + 1
+        return area_versions[area]
+
+
 def time_until(target_time: timedelta) -> timedelta:
     """Returns the time until a given time occurs.
 
@@ -91,35 +206,128 @@ def time_until(target_time: timedelta) -> timedelta:
     return time_delta
 
 
+class NewsBlacklist:
+    """The users blacklisted news article titles, held in memory as a set.
+
+    The blacklist is stored as a snapshot in news-blacklist.json, and every newly blacklisted
+    title is appended to a journal file. Once the journal is longer than
+    BLACKLIST_COMPACT_THRESHOLD titles, they are merged into the snapshot and the journal is
+    emptied, so blacklisting a title does not depend on the length of the blacklist.
+
+    Attributes:
+        filename (str): The snapshot file.
+        journal_filename (str): The journal file.
+    """
+
+    def __init__(
+        self,
+        filename: str = "news-blacklist.json",
+        journal_filename: str = "news-blacklist.journal",
+    ) -> None:
+        self.filename = filename
+        self.journal_filename = journal_filename
+        self._titles: Optional[dict] = None
+        self._journal_length = 0
+        self._lock = threading.RLock()
+
+    def __contains__(self, title: str) -> bool:
+        return title in self._load()
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+    def titles(self) -> list:
+        """Get every blacklisted title.
+
+        Returns:
+            list: Blacklisted news article titles, in the order they were blacklisted.
+        """
+        with self._lock:
+            return list(self._load())
+
+    def add(self, title: str) -> None:
+        """Blacklist a title, and append it to the journal.
+
+        Args:
+            title (str): The news article title.
+        """
+        with self._lock:
+            titles = self._load()
+            if title in titles:
+                return
+            titles[title] = None
+            with open(self.journal_filename, "a", encoding="utf-8") as file:
+                file.write(json.dumps(title) + "\n")
+            self._journal_length += 1
+            if self._journal_length > BLACKLIST_COMPACT_THRESHOLD:
+                self.compact()
+
+    def compact(self) -> None:
+        """Write every blacklisted title to the snapshot, and empty the journal."""
+        with self._lock:
+            titles = self._load()
+            log.info("Compacting %s blacklisted titles into %s", len(titles), self.filename)
+            temporary_filename = self.filename + ".tmp"
+            with open(temporary_filename, "w", encoding="utf-8") as file:
+                json.dump({"blacklist": list(titles)}, file)
+            os.replace(temporary_filename, self.filename)
+            with open(self.journal_filename, "w", encoding="utf-8"):
+                pass
+            self._journal_length = 0
+
+    def _load(self) -> dict:
+        # A dict is used as an insertion ordered set
+        if self._titles is not None:
+            return self._titles
+        with self._lock:
+            if self._titles is not None:
+                return self._titles
+            try:
+                with open(self.filename, encoding="utf-8") as file:
+                    log.info("Getting news blacklist from %s", self.filename)
+                    titles = dict.fromkeys(json.load(file)["blacklist"])
+            except FileNotFoundError:
+                log.warning("No %s found, creating a new one", self.filename)
+                titles = {}
+                with open(self.filename, "w", encoding="utf-8") as file:
+                    json.dump({"blacklist": []}, file)
+            self._journal_length = 0
+            try:
+                with open(self.journal_filename, encoding="utf-8") as file:
+                    for line in file:
+                        try:
+                            titles[json.loads(line)] = None
+                            self._journal_length += 1
+                        except ValueError:
+                            log.warning("Ignoring incomplete line in %s", self.journal_filename)
+            except FileNotFoundError:
+                pass
+            self._titles = titles
+            if self._journal_length > BLACKLIST_COMPACT_THRESHOLD:
+                self.compact()
+            return titles
+
+
+news_blacklist = NewsBlacklist()
+
+
 def get_news_blacklist() -> list:
     """Get the users news blacklist from news-blacklist.json.
 
     Returns:
         list: List of blacklisted news article titles
     """
-    try:
-        with open("news-blacklist.json", encoding="utf-8") as file:
-            log.info("Getting news blacklist from news-blacklist.json")
-            user_blacklist = json.load(file)
-    except FileNotFoundError:
-        log.warning("No news-blacklist.json found, creating a new one")
-        user_blacklist = {"blacklist": []}
-        with open("news-blacklist.json", "w", encoding="utf-8") as file:
-            json.dump(user_blacklist, file)
-    return user_blacklist["blacklist"]
+    return news_blacklist.titles()
 
 
 def blacklist(title: str) -> None:
-    """Blacklist a new news article, and add it to the users news-blacklist.json.
+    """Blacklist a new news article, and add it to the users news blacklist.
 
     Args:
         title (str): The title of the news article that should be blacklisted.
     """
-    stored_blacklist = list(get_news_blacklist())
-    stored_blacklist.append(title)
     log.info("Blacklisting %s", title)
-    with open("news-blacklist.json", "w", encoding="utf-8") as file:
-        json.dump({"blacklist": stored_blacklist}, file)
+    news_blacklist.add(title)
 
 
 # from https://stackoverflow.com/questions/753052/strip-html-from-strings-in-python
@@ -143,15 +351,22 @@ class HTMLStripper(HTMLParser):
         return self.text.getvalue()
 
 
+@lru_cache(maxsize=SANITISE_CACHE_SIZE)
 def sanitise_input(html: str) -> str:
     """Sanitises any string and removes any potentially malicious HTML tags.
 
+    Strings without any tags or character references are returned as they are, without being
+    parsed, and the most recent results are cached since the same articles are seen on every
+    news update.
+
     Args:
         html (str): A string which may contain HTML.
 
     Returns:
         str: A sanitised version of the input string, with all HTML removed.
     """
+    if "<" not in html and "&" not in html:
+        return html
     sanitiser = HTMLStripper()
     sanitiser.feed(html)
     return sanitiser.get_data()